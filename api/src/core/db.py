@@ -1,5 +1,6 @@
 from sqlmodel import create_engine, SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 from src.core.settings import settings
@@ -16,6 +17,30 @@ async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# create_all only creates missing tables, so columns and indexes added to
+# existing tables are brought in here. Every statement is idempotent and a
+# no-op on a database created from the current models.
+SCHEMA_UPGRADES = [
+    # Exam config header details
+    "ALTER TABLE exam_config ADD COLUMN IF NOT EXISTS exam_title VARCHAR",
+    "ALTER TABLE exam_config ADD COLUMN IF NOT EXISTS exam_date VARCHAR",
+    "ALTER TABLE exam_config ADD COLUMN IF NOT EXISTS semester VARCHAR",
+    "ALTER TABLE exam_config ADD COLUMN IF NOT EXISTS academic_year VARCHAR",
+    # Topics are looked up by name within a subject
+    "CREATE INDEX IF NOT EXISTS ix_topic_subject_id_name ON topic (subject_id, name)",
+    "DROP INDEX IF EXISTS ix_topic_name",
+    # Variant details kept with every exam
+    "ALTER TABLE exam ADD COLUMN IF NOT EXISTS variant_number INTEGER",
+    "ALTER TABLE exam ADD COLUMN IF NOT EXISTS seed INTEGER",
+    "ALTER TABLE exam ADD COLUMN IF NOT EXISTS template_version VARCHAR(32)",
+    "ALTER TABLE exam ADD COLUMN IF NOT EXISTS pdf_sha256 VARCHAR(64)",
+    # Stored LaTeX fragments (NULL ones are escaped when read) and the compile check flag
+    "ALTER TABLE question ADD COLUMN IF NOT EXISTS latex_text VARCHAR",
+    "ALTER TABLE question_option ADD COLUMN IF NOT EXISTS latex_text VARCHAR",
+    "ALTER TABLE question ADD COLUMN IF NOT EXISTS compiles BOOLEAN",
+    "CREATE INDEX IF NOT EXISTS ix_question_compiles ON question (compiles)",
+]
+
 async def get_session() -> AsyncSession:
     """Dependency to get async database session"""
     async with async_session() as session:
@@ -28,6 +53,8 @@ async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
 
 async def create_db_and_tables():
     """Create all database tables (for lifespan event)"""
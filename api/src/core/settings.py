@@ -21,6 +21,39 @@ class Settings(BaseSettings):
     KEYCLOAK_ADMIN_USERNAME: str = Field(default="admin") # Default admin username
     KEYCLOAK_ADMIN_PASSWORD: str = Field(default="admin") # Default admin password
 
+    # Exam generation
+    PDF_RENDERER: str = Field(default="auto") # "latex", "reportlab", or "auto" = reportlab unless a question needs TeX
+    LATEX_MAX_WORKERS: int = Field(default=0) # Parallel pdflatex runs per request, 0 = one per CPU core
+    LATEX_COMPILE_SLOTS: int = Field(default=0) # Concurrent pdflatex runs across all requests, 0 = one per CPU core
+    LATEX_TIMEOUT: int = Field(default=30) # Seconds before a pdflatex run is killed
+    LATEX_SINGLE_DOCUMENT: bool = Field(default=False) # Compile all variants in one pdflatex run and split the PDF
+    LATEX_FORMAT_DIR: str = Field(default="data/latex") # Where the precompiled preamble format is stored
+    PDF_CACHE_DIR: str = Field(default="data/pdf_cache") # Compiled PDFs keyed by a hash of their inputs
+    PDF_STORE_DIR: str = Field(default="data/pdf_store") # Rendered exam PDFs, content-addressed, kept for re-downloads
+    PDF_CACHE_MAX_BYTES: int = Field(default=512 * 1024 * 1024) # LRU eviction threshold, 0 disables the cache
+    QUESTION_BANK_MAX_BYTES: int = Field(default=64 * 1024 * 1024) # Memory for cached subject question banks, LRU eviction, 0 disables
+    QUESTION_BANK_TTL_SECONDS: int = Field(default=300) # Reload cached banks after this long, for writes made by other processes; 0 = never
+    QUESTION_CHECK_BATCH: int = Field(default=200) # Questions compiled together by the background check, 0 disables it
+    QUESTION_CHECK_POLL_SECONDS: int = Field(default=30) # How often the idle check looks for new or edited questions
+    QUESTION_CHECK_RETRY_SECONDS: int = Field(default=600) # Wait before checking again questions whose check timed out or could not run
+    QUESTION_REUSE_WINDOW: int = Field(default=3) # Past exam configs of the subject whose questions count as recently used, 0 = ignore history
+    QUESTION_REUSE_POLICY: str = Field(default="downweight") # "exclude" = only top up with used questions, "downweight" = sample them less often
+    QUESTION_REUSE_DECAY: float = Field(default=0.25) # Sampling weight multiplier per recent use with "downweight"
+    GENERATION_MAX_ACTIVE: int = Field(default=2) # Generations compiling at once per API process; the rest wait in a fair queue
+    GENERATION_QUEUE_SIZE: int = Field(default=20) # Waiting generations before new requests get 429 Too Many Requests
+    SINGLE_FLIGHT_WINDOW_SECONDS: int = Field(default=30) # Identical job submissions this soon after the first job finished get that job
+    TRUSTED_PROXIES: str = Field(default="127.0.0.1/32,::1/128") # Comma-separated networks whose X-Forwarded-For is used for the client address
+
+    # Scanned answer sheets
+    OMR_WORKERS: int = Field(default=0) # Processes reading scanned pages, 0 = one per CPU core
+    OMR_DPI: int = Field(default=200) # Resolution scanned PDF pages are rendered at
+
+    # Exam generation jobs
+    EXAM_JOB_WORKERS: int = Field(default=1) # Jobs processed concurrently by each API process
+    EXAM_JOB_POLL_SECONDS: int = Field(default=5) # How often idle workers check the queue
+    EXAM_JOB_STALE_SECONDS: int = Field(default=120) # Running jobs without a heartbeat for this long are requeued
+    EXAM_JOBS_DIR: str = Field(default="data/exam_jobs") # Where finished ZIPs are stored
+
     @property
     def PGSQL_DATABASE_URI(self) -> str:
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
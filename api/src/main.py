@@ -3,6 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from src.core.db import create_db_and_tables
 from src.core.config import setup_logging
+from src.core.settings import settings
+import asyncio
 import logging
 
 setup_logging()
@@ -30,10 +32,28 @@ async def lifespan(app: FastAPI):
         logger.info("Database connection verified")
     except Exception as e:
         logger.error(f"Database connection verification failed: {str(e)}")
+
+    # Load the LaTeX templates once; exams are rendered from memory
+    from src.services.template_registry import template_registry
+    template_registry.load()
+
+    # Start exam generation job workers
+    from src.services.exam_job import run_worker
+    job_workers = [asyncio.create_task(run_worker()) for _ in range(settings.EXAM_JOB_WORKERS)]
+    logger.info(f"Started {len(job_workers)} exam job workers")
+
+    # Compile new and edited questions in the background
+    from src.services.question_check import run_checker
+    background_tasks = job_workers + ([asyncio.create_task(run_checker())] if settings.QUESTION_CHECK_BATCH > 0 else [])
     
     yield
     
     logger.info("Application shutting down...")
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    from src.services.omr import shutdown_pool
+    shutdown_pool()
 
 app = FastAPI(
     title="Education Platform API",
@@ -1,6 +1,9 @@
 from src.models.exam_config import *
 from src.models.exam import *
+from src.models.exam_question import *
+from src.models.exam_job import *
 from src.models.question_option import *
+from src.models.question_usage import *
 from src.models.question import *
 from src.models.subject import *
 from src.models.topic import *
@@ -10,7 +13,10 @@ from src.models.workbook import *
 __all__ = [
     "ExamConfig",
     "Exam",
+    "ExamQuestion",
+    "ExamJob",
     "QuestionOption",
+    "QuestionUsage",
     "Question",
     "Subject",
     "Topic",
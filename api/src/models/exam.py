@@ -9,10 +9,18 @@ class Exam(SQLModel, table=True):
     
     id: Optional[int] = Field(default=None, primary_key=True)
     exam_config_id: int = Field(foreign_key="exam_config.id")
-    exam_xml: Optional[str] = Field(default=None)
+    exam_xml: Optional[str] = Field(default=None)  # Legacy: full question LaTeX, no longer written
+    variant_number: Optional[int] = Field(default=None)
+    seed: Optional[int] = Field(default=None)  # Seed of the RNG that sampled this variant
+    template_version: Optional[str] = Field(default=None, max_length=32)  # LaTeX templates it was generated with
+    pdf_sha256: Optional[str] = Field(default=None, max_length=64)  # Rendered PDF in the blob store
     
     # Relationships
     exam_config: "ExamConfig" = Relationship(back_populates="exams")
+    questions: List["ExamQuestion"] = Relationship(
+        back_populates="exam",
+        sa_relationship_kwargs={"cascade": "all, delete-orphan", "order_by": "ExamQuestion.position"}
+    )
 
 # Exam schemas
 class ExamCreate(SQLModel):
@@ -30,11 +38,51 @@ class ExamRead(SQLModel):
     id: int
     exam_config_id: int
     exam_xml: Optional[str] = None
+    variant_number: Optional[int] = None
+    seed: Optional[int] = None
+    template_version: Optional[str] = None
 
 class ExamPublic(SQLModel):
     """Schema for public exam data (no answers exposed)"""
     id: int
     exam_config_id: int
 
-    
 
+# Grading schemas
+class ExamResponses(SQLModel):
+    """Student responses for one variant: one row of option letters per student.
+
+    Empty or unrecognised cells (blank or cancelled answers) count as unanswered.
+    """
+    students: List[str]
+    answers: List[List[str]]
+
+class StudentGrade(SQLModel):
+    """Score of one student"""
+    student: str
+    score: float
+    correct: int
+    wrong: int
+    unanswered: int
+
+class ExamGradingResult(SQLModel):
+    """Scores of a batch of students on one variant"""
+    exam_id: int
+    variant_number: Optional[int] = None
+    max_score: float
+    mean_score: float
+    question_correct_rate: List[float]
+    voided_questions: List[int] = []  # Question numbers without a correct option, scored for nobody
+    grades: List[StudentGrade]
+
+class OmrSheet(SQLModel):
+    """One scanned answer sheet as read by OMR"""
+    sheet: str  # Source file, with the page number for PDFs
+    variant_number: Optional[int] = None
+    answers: List[str] = []
+    error: Optional[str] = None
+
+class OmrGradingResult(SQLModel):
+    """Every scanned sheet, and the grades of the readable ones per variant"""
+    sheets: List[OmrSheet]
+    results: List[ExamGradingResult]
@@ -13,6 +13,11 @@ class ExamConfig(SQLModel, table=True):
     #creator_keycloak_id: str = Field(max_length=255)
     fraction: int = Field(default=0)
     subject_id: int = Field(foreign_key="subject.id")
+    # Header details used when the variants are rendered
+    exam_title: Optional[str] = Field(default=None)
+    exam_date: Optional[str] = Field(default=None)
+    semester: Optional[str] = Field(default=None)
+    academic_year: Optional[str] = Field(default=None)
     
     topic_configs: List["TopicConfig"] = Relationship(back_populates="exam_config",
                                                      sa_relationship_kwargs={"cascade": "all, delete-orphan"})
@@ -0,0 +1,45 @@
+from typing import Optional
+from datetime import datetime, timezone
+from uuid import uuid4
+from sqlalchemy import Column, JSON
+from sqlmodel import Field, SQLModel
+from enum import Enum
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, matching the TIMESTAMP WITHOUT TIME ZONE columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ExamJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# ExamJob model - queued exam generation, persisted so it survives worker restarts
+class ExamJob(SQLModel, table=True):
+    __tablename__ = "exam_job"
+
+    id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True, max_length=32)
+    status: ExamJobStatus = Field(default=ExamJobStatus.PENDING, index=True)
+    exam_specs: dict = Field(sa_column=Column(JSON, nullable=False))
+    request_key: Optional[str] = Field(default=None, index=True, max_length=64)  # Hash of the specs and caller, for deduplication
+    num_variations: int = Field(default=1)
+    # Created by the first attempt, so a retried job does not create another config
+    exam_config_id: Optional[int] = Field(default=None, foreign_key="exam_config.id", ondelete="SET NULL")
+    result_path: Optional[str] = Field(default=None)
+    error: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)  # Doubles as the worker heartbeat while running
+
+# ExamJob schemas
+class ExamJobPublic(SQLModel):
+    """Schema for reporting job status"""
+    id: str
+    status: ExamJobStatus
+    num_variations: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
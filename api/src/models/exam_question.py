@@ -0,0 +1,19 @@
+from typing import Optional, List
+from sqlalchemy import Column, JSON
+from sqlmodel import Field, SQLModel, Relationship
+
+
+# ExamQuestion model - one question of an exam variant, in exam order
+class ExamQuestion(SQLModel, table=True):
+    __tablename__ = "exam_question"
+
+    exam_id: int = Field(foreign_key="exam.id", primary_key=True, ondelete="CASCADE")
+    position: int = Field(primary_key=True)  # 1-based question number in the variant
+    # Kept as NULL if the question is later deleted, so the rest of the exam still reads
+    question_id: Optional[int] = Field(default=None, foreign_key="question.id", index=True, ondelete="SET NULL")
+    option_ids: List[int] = Field(sa_column=Column(JSON, nullable=False))  # Chosen options in display order
+    answer: str = Field(default="", max_length=1)  # Letter of the correct option, "" if none
+    weight: float  # Points of the question
+
+    # Relationships
+    exam: "Exam" = Relationship(back_populates="questions")
@@ -9,6 +9,8 @@ class Question(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     topic_id: int = Field(foreign_key="topic.id")
     question_text: str = Field(default="Empty Question")
+    latex_text: Optional[str] = Field(default=None)  # question_text escaped for LaTeX, refreshed on every write
+    compiles: Optional[bool] = Field(default=None, index=True)  # Set by the background check, None until checked
     
     # Relationships
     topic: "Topic" = Relationship(back_populates="questions")
@@ -35,6 +37,7 @@ class QuestionPublic(SQLModel):
     id: int
     topic_id: int
     question_text: str
+    compiles: Optional[bool] = None
 
 class QuestionDelete(SQLModel):
     """Schema for deleting a question"""
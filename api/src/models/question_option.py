@@ -11,6 +11,7 @@ class QuestionOption(SQLModel, table=True):
     option_text: str = Field(max_length=500)
     value: bool = Field(default=False)  # 100.0 for correct, negative for incorrect (based on penalty)
     order_position: Optional[int] = Field(default=None)  # For displaying options in specific order
+    latex_text: Optional[str] = Field(default=None)  # option_text escaped for LaTeX, refreshed on every write
     
     # Relationships
     question: "Question" = Relationship(back_populates="question_options")
@@ -0,0 +1,21 @@
+from typing import Optional
+from datetime import datetime
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+from src.models.exam_job import utcnow
+
+
+# QuestionUsage model - one row per question placed in a generated exam variant
+class QuestionUsage(SQLModel, table=True):
+    __tablename__ = "question_usage"
+    # Recent usage is looked up per subject over its latest exam configs
+    __table_args__ = (
+        Index("ix_question_usage_subject_id_exam_config_id_question_id", "subject_id", "exam_config_id", "question_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    subject_id: int = Field(foreign_key="subject.id")
+    exam_config_id: int = Field(foreign_key="exam_config.id")
+    exam_id: int = Field(foreign_key="exam.id", index=True, ondelete="CASCADE")
+    question_id: int = Field(foreign_key="question.id", index=True, ondelete="CASCADE")
+    used_at: datetime = Field(default_factory=utcnow)
@@ -1,14 +1,16 @@
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
-from enum import Enum
 
 
 class Topic(SQLModel, table=True):
     __tablename__ = "topic"
+    # Topics are looked up by name within a subject
+    __table_args__ = (Index("ix_topic_subject_id_name", "subject_id", "name"),)
     
     id: Optional[int] = Field(default=None, primary_key=True)
     subject_id: int = Field(foreign_key="subject.id")
-    name: str = Field(index=True)
+    name: str
     
     # Relationships
     subject: "Subject" = Relationship(back_populates="topics")
@@ -1,14 +1,23 @@
 # src/routers/exam.py
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
-from src.services import exam
-from src.core.db import get_session
-from src.models.user import User
+from src.services import exam, exam_job, grading, omr
+from src.services.admission import QueueFull, generation_admission
+from src.services.pdf_cache import pdf_cache
+from src.services.question_bank import question_bank
+from src.services.single_flight import caller_of, generation_flights, request_key
+from src.core.db import async_session, get_session
+from src.models.exam import ExamGradingResult, ExamResponses, OmrGradingResult
 from src.models.exam_config import ExamConfigResponse
+from src.models.exam_job import ExamJobPublic, ExamJobStatus
 from src.models.topic_config import TopicConfigDTO
-from src.core.deps import get_current_user_info
 import logging
+import os
+import shutil
+import tempfile
 import traceback
 
 logger = logging.getLogger(__name__)
@@ -52,31 +61,52 @@ async def get_subject_exam_configs(
 @router.post("/generate")
 async def generate_exams(
     exam_specs: dict,
-    session: AsyncSession = Depends(get_session),
+    request: Request,
     #current_user: User = Depends(get_current_user_info)
 ):
     """
     Generate exams based on specifications.
-    Returns a ZIP file containing the generated exam PDFs.
+    Streams a ZIP file containing the generated exam PDFs.
     """
     try:
         num_variations = exam_specs.get("num_variations", 1)
 
-        zip_bytes = await exam.create_configs_and_exams(
-            session, 
-            exam_specs, 
-            #current_user, 
-            num_variations
-        )
+        # Identical requests from the same caller (double-clicks, retries)
+        # share one generation and all receive its ZIP
+        caller = caller_of(request)
+
+        async def start(is_disconnected):
+            # The setup is shared and outlives the request that began it, so it
+            # gets its own session instead of this request's
+            async with async_session() as session:
+                return await exam.generate_with_admission(
+                    session, 
+                    exam_specs, 
+                    #current_user, 
+                    num_variations,
+                    caller,
+                    is_disconnected
+                )
+
+        zip_stream = await generation_flights.stream(request_key(exam_specs, caller), start, request.is_disconnected)
 
-        logger.info(f"Successfully generated {num_variations} exam variations.")
+        logger.info(f"Streaming {num_variations} exam variations.")
 
-        return Response(
-            content=zip_bytes, 
+        # PDFs are compiled and added to the archive while it is being sent;
+        # compiling stops if the client disconnects
+        return StreamingResponse(
+            zip_stream,
             media_type="application/zip",
             headers={"Content-Disposition": "attachment; filename=exams.zip"}
         )
 
+    except QueueFull as qf:
+        logger.warning(f"Rejected exam generation: {qf}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(qf),
+            headers={"Retry-After": str(qf.retry_after)}
+        )
     except ValueError as ve:
         logger.warning(f"Validation error during config creation: {ve}")
         raise HTTPException(
@@ -89,4 +119,160 @@ async def generate_exams(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/metrics", response_model=dict)
+async def get_generation_metrics():
+    """Admission queue depth and wait times, plus PDF cache and question bank usage, for this API process."""
+    return {
+        "admission": generation_admission.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "question_bank": question_bank.stats(),
+    }
+
+
+@router.post("/jobs", response_model=ExamJobPublic, status_code=status.HTTP_202_ACCEPTED)
+async def submit_exam_job(
+    exam_specs: dict,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Queue exam generation in the background.
+    Returns the job immediately; poll its status and download the ZIP once done.
+    Submitting the same specs again returns the existing job.
+    """
+    job = await exam_job.submit_job(session, exam_specs, caller_of(request))
+    logger.info(f"Queued exam job {job.id} ({job.num_variations} variations)")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=ExamJobPublic)
+async def get_exam_job(
+    job_id: str,
+    session: AsyncSession = Depends(get_session),
+):
+    """Get the status of an exam generation job."""
+    job = await exam_job.get_job(session, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_exam_job(
+    job_id: str,
+    session: AsyncSession = Depends(get_session),
+):
+    """Download the ZIP produced by a finished exam generation job."""
+    job = await exam_job.get_job(session, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == ExamJobStatus.FAILED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job failed: {job.error}")
+    if job.status != ExamJobStatus.DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is still {job.status.value}")
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Job result is no longer available")
+
+    return FileResponse(job.result_path, media_type="application/zip", filename="exams.zip")
+
+
+@router.post("/{exam_id}/grade", response_model=ExamGradingResult)
+async def grade_exam(
+    exam_id: int,
+    responses: ExamResponses,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Grade a batch of student responses to one exam variant.
+    Each row of answers holds one option letter (or nothing) per question.
+    """
+    return await _grade(session, exam_id, responses.students, responses.answers)
+
+
+@router.post("/{exam_id}/grade/csv", response_model=ExamGradingResult)
+async def grade_exam_csv(
+    exam_id: int,
+    file: UploadFile,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Grade student responses uploaded as CSV: the student id, then one answer per question.
+    """
+    content = (await file.read()).decode("utf-8-sig")
+    students, answers = grading.parse_responses_csv(content)
+    return await _grade(session, exam_id, students, answers)
+
+
+async def _grade(session: AsyncSession, exam_id: int, students: List[str], answers: List[List[str]]) -> ExamGradingResult:
+    try:
+        result = await grading.grade_exam(session, exam_id, students, answers)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    return result
+
+
+@router.post("/configs/{config_id}/scans", response_model=OmrGradingResult)
+async def grade_scans(
+    config_id: int,
+    files: List[UploadFile] = File(...),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Grade scanned answer sheets: multi-page PDFs and/or page images.
+    Each sheet's variant is read from its QR code.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for index, upload in enumerate(files):
+            # Keep upload order, which is the order sheets are reported in
+            name = f"{index:05d}_{os.path.basename(upload.filename or 'scan')}"
+            with open(os.path.join(tmpdir, name), "wb") as f:
+                # Copied on a worker thread so large scans do not block the event loop
+                await run_in_threadpool(shutil.copyfileobj, upload.file, f)
+        try:
+            return await omr.grade_scans(session, config_id, tmpdir)
+        except ValueError as ve:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+        except RuntimeError as re:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(re))
+
+
+@router.get("/{exam_id}/pdf")
+async def get_exam_pdf(
+    exam_id: int,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Download the PDF of a stored exam variant.
+    Rendered on first access, then served straight from disk with ETag and Range support.
+    """
+    try:
+        stored = await exam.get_exam_pdf_path(session, exam_id)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(ve))
+    except RuntimeError as re:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(re))
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Exam not found")
+    path, digest = stored
+
+    # The content hash is a strong validator: the file behind it never changes
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=f"exam_{exam_id}.pdf",
+        content_disposition_type="inline",
+        headers=headers,
+    )
+
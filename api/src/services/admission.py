@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Hashable
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# How often a queued request checks that its client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+class QueueFull(Exception):
+    """The wait queue is full; retry_after estimates in seconds when a place frees up."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many exam generations queued, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Caps how many generations compile at once and queues the rest fairly.
+
+    Waiting requests are grouped by key (the caller and subject). Whenever
+    a slot frees up it goes to the oldest waiter of the next key in
+    round-robin order, so a user queueing many generations does not hold
+    back everyone else. Once max_queued requests wait, new ones are
+    rejected with QueueFull.
+    """
+
+    def __init__(self, max_active: int, max_queued: int):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self._queues: OrderedDict[Hashable, Deque[asyncio.Future]] = OrderedDict()
+        self.admitted = 0
+        self.rejected = 0
+        self.abandoned = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._avg_duration = float(settings.LATEX_TIMEOUT)  # Moving average of how long a slot is held
+
+    async def acquire(self, key: Hashable, bounded: bool = True, is_disconnected=None) -> float | None:
+        """Wait for a slot and return how long that took.
+
+        Raises QueueFull when bounded and the queue is full; unbounded
+        callers (background jobs, which are already queued) always wait.
+        With is_disconnected, a request whose client goes away leaves the
+        queue and gets None instead of a slot.
+        """
+        if self.active < self.max_active and not self.queued:
+            self.active += 1
+            self._record_wait(0.0)
+            return 0.0
+        if bounded and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            while not waiter.done():
+                await asyncio.wait({waiter}, timeout=DISCONNECT_POLL_SECONDS if is_disconnected else None)
+                if not waiter.done() and await is_disconnected():
+                    if waiter.done():
+                        self.release()  # Handed a slot while checking: pass it on
+                    else:
+                        self._remove(key, waiter)
+                    self.abandoned += 1
+                    return None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait was cancelled
+                self.release()
+            else:
+                self._remove(key, waiter)
+            raise
+        wait = time.monotonic() - started
+        self._record_wait(wait)
+        return wait
+
+    def release(self, held_seconds: float = None):
+        """Give a slot back, handing it to the next waiter if there is one."""
+        if held_seconds is not None:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * held_seconds
+        while self._queues:
+            key, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues[key] = queue  # Back of the round-robin order
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove(self, key: Hashable, waiter: asyncio.Future):
+        queue = self._queues.get(key)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[key]
+
+    def _record_wait(self, wait: float):
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely moved by one place."""
+        rounds = (self.queued + 1) / max(self.max_active, 1)
+        return max(1, math.ceil(self._avg_duration * rounds))
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "queue_depth": self.queued,
+            "max_queued": self.max_queued,
+            "queued_keys": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "abandoned": self.abandoned,
+            "wait_seconds_avg": self.total_wait / self.admitted if self.admitted else 0.0,
+            "wait_seconds_max": self.max_wait,
+            "hold_seconds_avg": self._avg_duration,
+        }
+
+
+class AdmittedStream:
+    """A stream that holds an admission slot and gives it back exactly once.
+
+    The slot is released when the stream ends, fails or is closed. Unlike the
+    finally of an async generator, aclose() also releases it when the stream
+    is closed before its first chunk.
+    """
+
+    def __init__(self, controller: AdmissionController, stream: AsyncIterator[bytes]):
+        self._controller = controller
+        self._stream = stream
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller.release(time.monotonic() - self._started)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await anext(self._stream)
+        except BaseException:
+            self.release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self.release()
+
+
+generation_admission = AdmissionController(settings.GENERATION_MAX_ACTIVE, settings.GENERATION_QUEUE_SIZE)
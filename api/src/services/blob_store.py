@@ -0,0 +1,43 @@
+import hashlib
+import logging
+import os
+import threading
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Immutable files on local disk named after the sha256 of their content.
+
+    Blobs are spread over two levels of subdirectories (ab/cd/abcd...) so no
+    directory grows too large. Writing the same content twice is a no-op.
+    """
+
+    def __init__(self, root: str, suffix: str = ""):
+        self.root = root
+        self.suffix = suffix
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}{self.suffix}")
+
+    def existing_path(self, digest: str) -> str | None:
+        path = self.path_for(digest)
+        return path if os.path.exists(path) else None
+
+    def put(self, data: bytes) -> str:
+        """Store data and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(staging, "wb") as f:
+            f.write(data)
+        os.replace(staging, path)
+        logger.info(f"Stored blob {digest} ({len(data)} bytes)")
+        return digest
+
+
+pdf_store = BlobStore(settings.PDF_STORE_DIR, ".pdf")
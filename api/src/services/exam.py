@@ -1,71 +1,97 @@
+import asyncio
 import logging
 import random
 import os
 import shutil
 import tempfile
-import subprocess
-from typing import Tuple, List, Dict
+from collections import deque
+from typing import AsyncIterator, Tuple, List, Dict
+import numpy as np
 from sqlmodel import select, func
+from sqlalchemy import delete, insert
 from sqlalchemy.orm import selectinload
 from sqlmodel.ext.asyncio.session import AsyncSession
-from src.models.user import User
+from src.core.db import async_session
+from src.core.settings import settings
 from src.models.exam_config import ExamConfig
 from src.models.topic_config import TopicConfig
 from src.models.topic import Topic
 from src.models.exam import Exam
+from src.models.exam_question import ExamQuestion
 from src.models.question import Question
-from src.models.question_option import QuestionOption
+from src.models.question_usage import QuestionUsage
 from src.models.subject import Subject
+from src.services.admission import AdmittedStream, generation_admission
+from src.services.blob_store import pdf_store
+from src.services.latex_renderer import questions_latex
+from src.services.pdf_cache import pdf_cache
+from src.services.question_bank import SubjectBank, question_bank
+from src.services.sampler import overlap_csv, sample_variants
+from src.services.renderer import DocumentHeader, RenderOption, RenderQuestion, SolutionsDocument, VariantDocument, select_renderer
+from src.services.template_registry import template_registry
 
 logger = logging.getLogger(__name__)
 
-TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "..", "latex_templates")
+# How often a streaming generation checks that its client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+_background_tasks = set()
 
 
 async def create_configs(
     session: AsyncSession,
     exam_specs: dict
 ) -> Tuple[ExamConfig, List[TopicConfig]]:
-    """Create ExamConfig and TopicConfigs."""
+    """Create ExamConfig and TopicConfigs in one transaction."""
     
     # Using a dummy user ID since authentication is disabled
     dummy_user_id = "default_user"
 
+    # Resolve the subject's requested topics and their usable question counts in one
+    # query; questions the background check found not to compile are never sampled
+    result = await session.exec(
+        select(Topic.id, Topic.name, func.count(Question.id).filter(Question.compiles.is_not(False)))
+        .outerjoin(Question, Question.topic_id == Topic.id)
+        .where(Topic.subject_id == exam_specs["subject_id"], Topic.name.in_(exam_specs["topics"]))
+        .group_by(Topic.id, Topic.name)
+        .order_by(Topic.id)
+    )
+    topics = {}
+    for topic_id, topic_name, available_questions in result.all():
+        topics.setdefault(topic_name, (topic_id, available_questions))
+
     # Validate question counts before creating configs
     for topic_name in exam_specs["topics"]:
-        result = await session.exec(select(Topic).where(Topic.name == topic_name))
-        topic = result.first()
-        if topic:
-            # Count available questions for this topic
-            count_result = await session.exec(
-                select(func.count(Question.id)).where(Question.topic_id == topic.id)
-            )
-            available_questions = count_result.one()
+        if topic_name in topics:
+            _, available_questions = topics[topic_name]
             requested_questions = exam_specs["number_questions"].get(topic_name, 0)
             
             if requested_questions > available_questions:
                 raise ValueError(
-                    f"Topic '{topic_name}' has only {available_questions} questions, "
+                    f"Topic '{topic_name}' has only {available_questions} questions that compile, "
                     f"but {requested_questions} were requested."
                 )
 
     exam_config = ExamConfig(
         subject_id=exam_specs["subject_id"],
         fraction=exam_specs["fraction"],
+        exam_title=exam_specs.get("exam_title", "Exame Época Normal"),
+        exam_date=exam_specs.get("exam_date"),
+        semester=exam_specs.get("semester", "1"),
+        academic_year=exam_specs.get("academic_year", "2025/26"),
         #creator_keycloak_id=dummy_user_id
     )
     session.add(exam_config)
-    await session.commit()
-    await session.refresh(exam_config)
+    # Assigns exam_config.id without committing
+    await session.flush()
 
     topic_configs = []
     for topic_name in exam_specs["topics"]:
-        result = await session.exec(select(Topic).where(Topic.name == topic_name))
-        topic = result.first()
-        if topic:
+        if topic_name in topics:
+            topic_id, _ = topics[topic_name]
             topic_config = TopicConfig(
                 exam_config_id=exam_config.id,
-                topic_id=topic.id,
+                topic_id=topic_id,
                 num_questions=exam_specs["number_questions"][topic_name],
                 relative_weight=exam_specs["relative_quotations"][topic_name],
                 #creator_keycloak_id=dummy_user_id
@@ -95,14 +121,38 @@ async def generate_exams_from_configs(
     exam_title: str = "Exame Época Normal",
     exam_date: str = None,
     semester: str = "1",
-    academic_year: str = "2025/26"
-) -> bytes:
-    """Generate LaTeX exams and answer keys, return ZIP with PDFs."""
-    import zipfile
-    import io
-
-    if shutil.which("pdflatex") is None:
-        raise RuntimeError("pdflatex is not installed. Please install it (e.g., 'sudo apt install texlive-latex-extra') or run the API via Docker.")
+    academic_year: str = "2025/26",
+    seed: int = None,
+    single_document: bool = None,
+    is_disconnected=None
+) -> AsyncIterator[bytes]:
+    """Generate exams and answer keys, return a stream of the ZIP with PDFs.
+
+    Generation runs in three phases: everything is fetched from the DB and
+    laid out before this returns (so validation errors are raised up front),
+    the PDFs are rendered without a DB connection while the returned iterator
+    is consumed, and the Exam rows are saved in one transaction at the end.
+
+    The questions of all variants are picked together by sample_variants,
+    which minimizes the overlap between variants and avoids questions used
+    in the subject's last QUESTION_REUSE_WINDOW exam configs according to
+    QUESTION_REUSE_POLICY; the resulting overlap matrix is added to the ZIP.
+    Question order and options are shuffled with a per-variant RNG. All RNGs
+    derive from seed when given, and each variant's seed, questions and
+    options are stored so it can be re-rendered later.
+
+    The PDF backend comes from select_renderer. With single_document
+    (default: LATEX_SINGLE_DOCUMENT) a backend that supports it renders all
+    variants in one pass.
+
+    is_disconnected, an async callable such as Request.is_disconnected, lets
+    the stream stop compiling as soon as the client goes away; saved exams
+    are then deleted again.
+    """
+    if single_document is None:
+        single_document = settings.LATEX_SINGLE_DOCUMENT
+    if num_variations < 1:
+        raise ValueError(f"num_variations must be at least 1, got {num_variations}")
     if not topic_configs:
         raise ValueError("No topic configurations provided - cannot generate exams")
 
@@ -112,385 +162,556 @@ async def generate_exams_from_configs(
     subject_name = subject.name if subject else "Unknown Subject"
 
     topic_weights = _compute_normalized_weights(topic_configs)
-    zip_buffer = io.BytesIO()
     all_answers_maps = {}
-    
-    with tempfile.TemporaryDirectory() as tmpdir:
-        exams_dir = os.path.join(tmpdir, "exams")
-        keys_dir = os.path.join(tmpdir, "answer_keys")
-        os.makedirs(exams_dir)
-        os.makedirs(keys_dir)
-
-        # Copy base templates
-        for f in os.listdir(TEMPLATES_DIR):
-            if f.endswith(".tex"):
-                shutil.copy(os.path.join(TEMPLATES_DIR, f), tmpdir)
-
-        # Write custom date.tex
-        if exam_date:
-            from datetime import datetime
-            date_obj = datetime.strptime(exam_date, "%Y-%m-%d")
-            formatted_date = date_obj.strftime("%d de %B de %Y")
-            # Portuguese month names
-            pt_months = {
-                "January": "janeiro", "February": "fevereiro", "March": "março",
-                "April": "abril", "May": "maio", "June": "junho",
-                "July": "julho", "August": "agosto", "September": "setembro",
-                "October": "outubro", "November": "novembro", "December": "dezembro"
-            }
-            for en, pt in pt_months.items():
-                formatted_date = formatted_date.replace(en, pt)
-            with open(os.path.join(tmpdir, "date.tex"), "w") as f:
-                f.write(formatted_date)
-
-        for var_num in range(1, num_variations + 1):
-            # Gather questions for this variation
-            all_questions = []
-            for t_conf in topic_configs:
-                result = await session.exec(
-                    select(Question)
-                    .where(Question.topic_id == t_conf.topic_id)
-                    .order_by(func.random())
-                    .limit(t_conf.num_questions)
-                )
-                all_questions.extend(result.all())
-            
-            # Load options for all questions
-            q_ids = [q.id for q in all_questions]
-            opts_by_q = {}
-            if q_ids:
-                opts_result = await session.exec(
-                    select(QuestionOption).where(QuestionOption.question_id.in_(q_ids))
-                )
-                all_opts = opts_result.all()
-                logger.info(f"Loaded {len(all_opts)} options for {len(q_ids)} questions")
-                for opt in all_opts:
-                    opts_by_q.setdefault(opt.question_id, []).append(opt)
-            
-            random.shuffle(all_questions)
-
-            # Generate T-variants.tex content and get answer positions
-            questions_latex, answers_map = _generate_questions_latex(all_questions, topic_weights, opts_by_q)
-            all_answers_maps[var_num] = answers_map
-            num_questions = len(all_questions)
-
-            # Write variant questions file
-            with open(os.path.join(tmpdir, "T-variants.tex"), "w") as f:
-                f.write(questions_latex)
-
-            # Update Rules.tex with actual number of questions and fraction
-            _update_rules(tmpdir, num_questions, exam_config.fraction / 100.0)
-
-            # Generate exam PDF (blank answer grid)
-            _write_blank_answers(tmpdir, num_questions)
-            exam_pdf = _compile_latex(tmpdir, "main_variants.tex", var_num, subject_name, exam_title, semester, academic_year)
-            if exam_pdf:
-                with open(os.path.join(exams_dir, f"exam_var_{var_num}.pdf"), "wb") as f:
-                    f.write(exam_pdf)
-
-            # Generate answer key PDF (marked grid)
-            ''' Temporarily disable this because of the new all_solutions.pdf
-            _write_answer_key(tmpdir, answers_map, num_questions)
-            key_pdf = _compile_latex(tmpdir, "main_variants.tex", var_num, subject_name, exam_title, semester, academic_year)
-            if key_pdf:
-                with open(os.path.join(keys_dir, f"answer_key_var_{var_num}.pdf"), "wb") as f:
-                    f.write(key_pdf)
-            '''
-
-            # Save exam to DB
-            new_exam = Exam(exam_config_id=exam_config.id, exam_xml=questions_latex)
-            session.add(new_exam)
-            await session.commit()
-
-        # Generate single solutions PDF with all variations
-        _write_all_solutions(tmpdir, all_answers_maps, num_questions, exam_title)
-        solutions_pdf = _compile_latex(tmpdir, "solutions.tex", 1, subject_name, exam_title, semester, academic_year)
-        if solutions_pdf:
-            with open(os.path.join(keys_dir, "all_solutions.pdf"), "wb") as f:
-                f.write(solutions_pdf)
-
-        if not os.listdir(exams_dir):
-             raise RuntimeError("No exams were generated. LaTeX compilation likely failed. Check logs for details.")
-
-        # Create ZIP
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for f in os.listdir(exams_dir):
-                zf.write(os.path.join(exams_dir, f), f"exams/{f}")
-            for f in os.listdir(keys_dir):
-                zf.write(os.path.join(keys_dir, f), f"answer_keys/{f}")
-
-    return zip_buffer.getvalue()
-
-
-def _generate_questions_latex(questions: list, topic_weights: Dict[int, float], opts_by_q: Dict[int, list], num_options: int = 4) -> Tuple[str, Dict[int, str]]:
-    """Generate LaTeX for questions and return answer map."""
-    lines = []
-    answers_map = {}
-    
-    for q_num, q in enumerate(questions, 1):
-        weight = topic_weights.get(q.topic_id, 1.0)
-        lines.append(f"\\question")
-        lines.append(f"({weight:.2f} pts) {q.question_text}")
-        lines.append("\\nopagebreak")
-        lines.append("")
-        
-        all_opts = opts_by_q.get(q.id, [])
-        logger.info(f"Question {q.id} has {len(all_opts)} options")
-        correct_opts = [o for o in all_opts if o.value]
-        wrong_opts = [o for o in all_opts if not o.value]
-        
-        # Pick one correct option
-        correct = correct_opts[0] if correct_opts else None
-        
-        # Fill wrong options up to num_options - 1
-        random.shuffle(wrong_opts)
-        selected_wrong = wrong_opts[:num_options - 1]
-        
-        # Build final options list
-        final_opts = ([correct] if correct else []) + selected_wrong
-        random.shuffle(final_opts)
-        
-        lines.append("\\begin{choices}")
-        for i, opt in enumerate(final_opts):
-            if opt and opt.value:
-                lines.append(f"  \\CorrectChoice {opt.option_text}")
-                answers_map[q_num] = chr(ord('A') + i)
-            elif opt:
-                lines.append(f"  \\choice {opt.option_text}")
-        lines.append("\\end{choices}")
-        lines.append("")
-    
-    return "\n".join(lines), answers_map
+    date_text = _format_exam_date(exam_date) if exam_date else None
+    header = DocumentHeader(subject_name, semester, academic_year, exam_title, date_text)
+
+    # Sample every variant in-process from the subject's in-memory question
+    # bank, which also holds the selected questions' options
+    seed_source = random.Random(seed) if seed is not None else random.SystemRandom()
+    variant_seeds = [seed_source.randrange(2**31) for _ in range(num_variations)]
+    variant_rngs = [random.Random(variant_seed) for variant_seed in variant_seeds]
+    sampler_rng = np.random.default_rng(seed_source.randrange(2**63))
+    bank = await question_bank.get(session, exam_config.subject_id)
+    if bank is None:
+        raise ValueError(f"Subject {exam_config.subject_id} not found")
+    candidates = await _fetch_candidate_ids(session, bank, [tc.topic_id for tc in topic_configs])
+    selection = sample_variants(candidates, topic_configs, num_variations, sampler_rng)
+    selections = selection.question_ids
+    questions_by_id = bank.questions({q_id for ids in selections for q_id in ids})
+    logger.info(f"Sampled {num_variations} variations from {len(questions_by_id)} distinct questions, at most {selection.max_overlap} shared by two variants")
+
+    # Everything is loaded; end the transaction so the pooled connection is not
+    # held while rendering and compiling
+    await session.commit()
 
+    documents = []
+    new_exams = []
+    for var_num, (variant_seed, rng, question_ids) in enumerate(zip(variant_seeds, variant_rngs, selections), 1):
+        all_questions = [questions_by_id[q_id] for q_id in question_ids]
+        opts_by_q = {q.id: list(q.question_options) for q in all_questions}
+
+        rng.shuffle(all_questions)
+
+        # Lay out the questions and get answer positions
+        render_questions, answers_map, exam_questions = _generate_questions(all_questions, topic_weights, opts_by_q, rng=rng)
+        all_answers_maps[var_num] = answers_map
+        num_questions = len(all_questions)
+        documents.append(VariantDocument(header, var_num, exam_config.fraction, render_questions))
+
+        # Answer key PDF (marked grid)
+        # Temporarily disabled because of the new all_solutions.pdf:
+        # _answer_key_latex(answers_map, num_questions)
+
+        # Saved to the DB in one go once every PDF has compiled; the LaTeX is
+        # not stored, it is rendered again from the exam_question rows on demand
+        new_exams.append(Exam(
+            exam_config_id=exam_config.id,
+            variant_number=var_num,
+            seed=variant_seed,
+            template_version=template_registry.version,
+            questions=exam_questions,
+        ))
+
+    # The scratch directory lives as long as the ZIP stream that compiles from it
+    tmp = tempfile.TemporaryDirectory()
+    renderer = select_renderer(documents, tmp.name)
+    if renderer.name == "latex" and shutil.which("pdflatex") is None:
+        tmp.cleanup()
+        raise RuntimeError("pdflatex is not installed. Please install it (e.g., 'sudo apt install texlive-latex-extra') or run the API via Docker.")
+    logger.info(f"Rendering {num_variations} variations with the {renderer.name} renderer")
+
+    def variant_job(document: VariantDocument):
+        async def run() -> List[Tuple[str, bytes]]:
+            pdf = await renderer.render_variant(document)
+            return [(f"exams/exam_var_{document.variant_number}.pdf", pdf)] if pdf else []
+        return run
+
+    # Single solutions PDF with all variations
+    solutions = SolutionsDocument(header, all_answers_maps, num_questions)
+
+    async def solutions_job() -> List[Tuple[str, bytes]]:
+        pdf = await renderer.render_solutions(solutions)
+        return [("answer_keys/all_solutions.pdf", pdf)] if pdf else []
+
+    async def overlap_job() -> List[Tuple[str, bytes]]:
+        return [("answer_keys/variant_overlap.csv", overlap_csv(selection.overlap))]
+
+    variant_jobs = [variant_job(document) for document in documents]
+    if single_document and len(documents) > 1:
+        async def render_all_variants() -> List[Tuple[str, bytes]]:
+            pdfs = await renderer.render_variants(documents)
+            if pdfs is not None:
+                return [(f"exams/exam_var_{var_num}.pdf", pdf) for var_num, pdf in pdfs.items()]
+
+            logger.warning("Single-document rendering failed, rendering variants separately")
+            slots = asyncio.Semaphore(_compile_workers())
+
+            async def bounded(job):
+                async with slots:
+                    return await job()
+
+            results = await asyncio.gather(*(bounded(job) for job in variant_jobs))
+            return [entry for entries in results for entry in entries]
+
+        jobs = [render_all_variants, solutions_job, overlap_job]
+    else:
+        jobs = variant_jobs + [solutions_job, overlap_job]
+
+    async def persist_exams():
+        async with async_session() as persist_session:
+            persist_session.add_all(new_exams)
+            await persist_session.flush()
+            # Usage history in one multi-row insert, read back by _fetch_candidate_ids
+            await persist_session.execute(insert(QuestionUsage), [
+                {
+                    "subject_id": exam_config.subject_id,
+                    "exam_config_id": exam_config.id,
+                    "exam_id": exam.id,
+                    "question_id": exam_question.question_id,
+                }
+                for exam in new_exams
+                for exam_question in exam.questions
+            ])
+            await persist_session.commit()
+        logger.info(f"Saved {len(new_exams)} exams for config {exam_config.id}")
+
+    async def discard_exams():
+        exam_ids = [exam.id for exam in new_exams if exam.id is not None]
+        async with async_session() as discard_session:
+            # exam_question and question_usage rows go with them (ON DELETE CASCADE)
+            await discard_session.execute(delete(Exam).where(Exam.id.in_(exam_ids)))
+            await discard_session.commit()
+        logger.info(f"Deleted {len(exam_ids)} exams of config {exam_config.id}, the download was abandoned")
+
+    return _stream_zip(tmp, jobs, persist_exams, discard_exams, is_disconnected)
+
+
+class _ZipChunkWriter:
+    """Write-only file object that hands zipfile output over in chunks.
+
+    It has no tell() or seek(), so zipfile writes in streaming mode (sizes go
+    in data descriptors after each entry).
+    """
 
-def _get_answers_map(questions: list) -> Dict[int, str]:
-    """Return dict mapping question number (1-indexed) to correct answer letter."""
-    answers = {}
-    for idx, q in enumerate(questions, 1):
-        options = list(q.question_options)
-        random.seed(q.id)
-        random.shuffle(options)
-        for i, opt in enumerate(options):
-            if opt.value:
-                answers[idx] = chr(ord('A') + i)
-                break
-    return answers
-
-
-def _update_rules(workdir: str, num_questions: int, fraction: float):
-    """Update Rules.tex with actual number of questions and fraction."""
-    rules_path = os.path.join(workdir, "Rules.tex")
-    with open(rules_path, "r") as f:
-        content = f.read()
-    content = content.replace("#NUM_QUESTIONS", str(num_questions))
-    content = content.replace("#FRACTION", str(fraction))
-    with open(rules_path, "w") as f:
-        f.write(content)
-
-
-def _write_blank_answers(workdir: str, num_questions: int):
-    """Write blank T-answers.tex for student exam."""
-    cols = num_questions
-    header = " &".join([f"{i:02d}" for i in range(1, cols + 1)])
-    
-    rows = []
-    for letter in ['A', 'B', 'C', 'D']:
-        cells = [" " for _ in range(1, cols + 1)]
-        rows.append(f"{letter}& " + " & ".join(cells) + " \\\\ \\hline")
-    
-    content = f"""\\renewcommand{{\\arraystretch}}{{1.5}}
-\\begin{{center}}
-\\begin{{minipage}}{{0.15\\textwidth}}
-\\qrcode[height=0.75in]{{\\tttnumber}}
-\\end{{minipage}}%
-\\begin{{minipage}}{{0.80\\textwidth}}
-\\scriptsize
-\\begin{{center}}
-\\begin{{tabular}}{{|l|{'l|' * cols}}}
-\\hline
- &{header}\\\\ \\hline
-{chr(10).join(rows)}
-\end{{tabular}}
-\end{{center}}
-\\end{{minipage}}
-\\end{{center}}
-\\vspace{{0.25cm}}
-"""
-    with open(os.path.join(workdir, "T-answers.tex"), "w") as f:
-        f.write(content)
-
-
-def _write_answer_key(workdir: str, answers: Dict[int, str], num_questions: int):
-    """Write T-answers.tex with X marks in correct cells."""
-    cols = num_questions
-    header = " &".join([f"{i:02d}" for i in range(1, cols + 1)])
-    
-    rows = []
-    for letter in ['A', 'B', 'C', 'D']:
-        cells = [("X" if answers.get(q) == letter else " ") for q in range(1, cols + 1)]
-        rows.append(f"{letter}& " + " & ".join(cells) + " \\\\ \\hline")
-    
-    content = f"""\\renewcommand{{\\arraystretch}}{{1.5}}
-\\begin{{center}}
-\\begin{{minipage}}{{0.15\\textwidth}}
-\\qrcode[height=0.75in]{{\\tttnumber}}
-\\end{{minipage}}%
-\\begin{{minipage}}{{0.80\\textwidth}}
-\\scriptsize
-\\begin{{center}}
-\\begin{{tabular}}{{|l|{'l|' * cols}}}
-\\hline
- &{header}\\\\ \\hline
-{chr(10).join(rows)}
-\end{{tabular}}
-\end{{center}}
-\\end{{minipage}}
-\\end{{center}}
-\\vspace{{0.25cm}}
-"""
-    with open(os.path.join(workdir, "T-answers.tex"), "w") as f:
-        f.write(content)
-
-
-def _write_all_solutions(workdir: str, all_answers: Dict[int, Dict[int, str]], num_questions: int, exam_title: str = "Exame Época Normal"):
-    """Write solutions.tex with all variations in horizontal lines."""
-    content = f"""\\documentclass[a4paper,10pt]{{exam}}
-\\input{{H}}
-\\begin{{document}}
-
-\\begin{{center}}
-\\huge
-\\input{{UC}}
-
-\\vspace{{0.3cm}}
-\\normalsize
-{exam_title}
-\\\\
-\\input{{date}}
-
-\\vspace{{0.5cm}}
-\\Large \\textbf{{Soluções}}
-\\end{{center}}
-
-\\vspace{{0.5cm}}
-
-"""
-    
-    for var_num in sorted(all_answers.keys()):
-        answers = all_answers[var_num]
-        cols = num_questions
-        header = " &".join([f"{i:02d}" for i in range(1, cols + 1)])
-        
-        rows = []
-        for letter in ['A', 'B', 'C', 'D']:
-            cells = [("X" if answers.get(q) == letter else " ") for q in range(1, cols + 1)]
-            rows.append(f"{letter}& " + " & ".join(cells) + " \\\\ \\hline")
-        
-        content += f"""\\noindent\\rule{{\\textwidth}}{{0.4pt}}
-
-\\vspace{{0.3cm}}
-
-\\begin{{center}}
-\\begin{{tabular}}{{c c}}
-\\textbf{{Version {var_num}}} &
-\\renewcommand{{\\arraystretch}}{{1.5}}
-\\begin{{minipage}}{{0.75\\textwidth}}
-\\scriptsize
-\\begin{{center}}
-\\begin{{tabular}}{{|l|{'l|' * cols}}}
-\\hline
- &{header}\\\\ \\hline
-{chr(10).join(rows)}
-\\end{{tabular}}
-\\end{{center}}
-\\end{{minipage}}
-\\end{{tabular}}
-\\end{{center}}
-
-\\vspace{{0.3cm}}
-
-"""
-    
-    content += "\\end{document}"
-    
-    with open(os.path.join(workdir, "solutions.tex"), "w") as f:
-        f.write(content)
-
-
-def _compile_latex(workdir: str, main_file: str, var_num: int, subject_name: str = None, exam_title: str = "Exame Época Normal", semester: str = "1", academic_year: str = "2025/26") -> bytes | None:
-    """Compile LaTeX to PDF, return PDF bytes or None on failure."""
-    main_path = os.path.join(workdir, main_file)
-    with open(main_path, "r") as f:
-        content = f.read()
-    content = content.replace("\\newcommand\\tttnumber{0}", f"\\newcommand\\tttnumber{{{var_num}}}")
-    content = content.replace("#FOOTER", "")
-    content = content.replace("Exame Época Normal", exam_title)
-    with open(main_path, "w") as f:
-        f.write(content)
-
-    # Create subject-specific UC.tex if subject_name is provided
-    if subject_name:
-        semester_text_en = f"{semester}st Semester" if semester == "1" else f"{semester}nd Semester"
-        semester_text_pt = f"{semester}º Semestre"
-        uc_content = f"""\\iftoggle{{english}}{{
-{subject_name}\\\\
-{semester_text_en}, {academic_year}\\\\
-}}{{
-{subject_name}\\\\
-{semester_text_pt}, {academic_year}\\\\
-}}"""
-        with open(os.path.join(workdir, "UC.tex"), "w") as f:
-            f.write(uc_content)
-    
-    # Modify H.tex to include variation number after UC.tex
-    h_path = os.path.join(workdir, "H.tex")
-    if os.path.exists(h_path):
-        with open(h_path, "r") as f:
-            h_content = f.read()
-        # Only add if not already present (check for Versão pattern)
-        if "Versão" not in h_content:
-            h_content = h_content.replace(
-                "\\input{UC}",
-                f"\\input{{UC}}\n\t\\vspace{{0.2cm}}\n\t{{\\small \\textbf{{Versão {var_num}}}}}"
-            )
-        else:
-            # Replace existing version number
-            import re
-            h_content = re.sub(
-                r"Versão \d+",
-                f"Versão {var_num}",
-                h_content
-            )
+    def __init__(self):
+        self._chunks = []
 
-        with open(h_path, "w") as f:
-            f.write(h_content)
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _job_entries(task: asyncio.Task, is_disconnected=None) -> List[Tuple[str, bytes]] | None:
+    """Wait for a compile job, checking every DISCONNECT_POLL_SECONDS that the client is still there.
+
+    Returns None if the client disconnected first.
+    """
+    while is_disconnected is not None:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            break
+        if await is_disconnected():
+            return None
+    return await task
+
+
+async def _stream_zip(tmp: tempfile.TemporaryDirectory, jobs: list, on_complete, on_abort=None, is_disconnected=None) -> AsyncIterator[bytes]:
+    """Run the compile jobs and yield the ZIP archive chunk by chunk.
+
+    Each job is a coroutine function returning the (zip name, PDF bytes)
+    entries it produced. on_complete is awaited after the last PDF is
+    written and before the archive is closed, so a failure there aborts the
+    download.
+
+    At most _compile_workers() jobs are in flight, and entries are written
+    in job order, so memory stays bounded by that window and the archive
+    does not depend on which compile finishes first.
+
+    If is_disconnected reports the client gone, or the stream is closed or
+    cancelled before the end, the running jobs are cancelled (which kills
+    their pdflatex), tmp is removed once they have stopped, and on_abort is
+    run in the background if on_complete already saved anything.
+    """
+    import zipfile
+
+    window = min(_compile_workers(), len(jobs))
+    logger.info(f"Running {len(jobs)} compile jobs, up to {window} at a time")
+    pending_jobs = iter(jobs)
+    in_flight = deque()
+    persisted = completed = False
+
+    def schedule_next():
+        job = next(pending_jobs, None)
+        if job:
+            in_flight.append(asyncio.create_task(job()))
 
     try:
-        subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", main_file],
-            cwd=workdir, capture_output=True, timeout=30
+        for _ in range(window):
+            schedule_next()
+
+        writer = _ZipChunkWriter()
+        exams_written = 0
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as zf:
+            while in_flight:
+                entries = await _job_entries(in_flight[0], is_disconnected)
+                if entries is None:
+                    logger.info("Client disconnected, cancelling exam generation")
+                    return
+                in_flight.popleft()
+                schedule_next()
+                for zip_name, pdf in entries:
+                    _write_zip_entry(zf, zip_name, pdf)
+                    exams_written += zip_name.startswith("exams/")
+                    yield writer.drain()
+
+            if not exams_written:
+                raise RuntimeError("No exams were generated. PDF rendering likely failed. Check logs for details.")
+            await on_complete()
+            persisted = True
+        yield writer.drain()
+        completed = True
+        logger.info(f"PDF cache: {pdf_cache.stats()}")
+    finally:
+        # Nothing here awaits: a cancelled request may not get to run another await
+        if not completed:
+            logger.warning(f"ZIP stream abandoned with {len(in_flight)} compile jobs running")
+        for task in in_flight:
+            task.cancel()
+        # Remove the scratch directory only once every cancelled pdflatex is gone
+        stopped = asyncio.gather(*in_flight, return_exceptions=True)
+        stopped.add_done_callback(lambda _: tmp.cleanup())
+        if persisted and not completed and on_abort:
+            _run_in_background(on_abort())
+
+
+def _run_in_background(coro):
+    """Run coro as a task that is kept referenced until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _fetch_candidate_ids(session: AsyncSession, bank: SubjectBank, topic_ids: List[int]) -> Dict[int, List[Tuple[int, int]]]:
+    """Return (question id, recent uses) for every requested topic.
+
+    Question ids come from the subject's bank, without the questions the
+    background check found not to compile; recent uses count the
+    appearances of a question in the subject's last QUESTION_REUSE_WINDOW
+    exam configs, read from the question_usage index in a single query.
+    """
+    failing = bank.failing_question_ids(topic_ids)
+    if failing:
+        logger.warning(f"Skipping {len(failing)} questions that do not compile: {failing}")
+    uses = await _fetch_recent_uses(session, bank.subject_id)
+    return {
+        topic_id: [(question_id, uses.get(question_id, 0)) for question_id in bank.topic_question_ids(topic_id)]
+        for topic_id in topic_ids
+    }
+
+
+async def _fetch_recent_uses(session: AsyncSession, subject_id: int) -> Dict[int, int]:
+    """Question id -> appearances in the subject's last QUESTION_REUSE_WINDOW exam configs."""
+    if settings.QUESTION_REUSE_WINDOW <= 0:
+        return {}
+    recent_configs = (
+        select(QuestionUsage.exam_config_id)
+        .where(QuestionUsage.subject_id == subject_id)
+        .distinct()
+        .order_by(QuestionUsage.exam_config_id.desc())
+        .limit(settings.QUESTION_REUSE_WINDOW)
+        .subquery()
+    )
+    result = await session.exec(
+        select(QuestionUsage.question_id, func.count())
+        .where(
+            QuestionUsage.subject_id == subject_id,
+            QuestionUsage.exam_config_id.in_(select(recent_configs.c.exam_config_id)),
+        )
+        .group_by(QuestionUsage.question_id)
+    )
+    return dict(result.all())
+
+
+async def _load_questions(session: AsyncSession, question_ids: set) -> Dict[int, Question]:
+    """Load the given questions together with their options."""
+    if not question_ids:
+        return {}
+    result = await session.exec(
+        select(Question)
+        .where(Question.id.in_(question_ids))
+        .options(selectinload(Question.question_options))
+    )
+    return {q.id: q for q in result.all()}
+
+
+async def _load_exam_questions(session: AsyncSession, exam: Exam) -> Tuple[List[RenderQuestion], Dict[int, str], ExamConfig]:
+    """Rebuild a stored variant's questions and answer map from its exam_question rows."""
+    result = await session.exec(
+        select(ExamQuestion).where(ExamQuestion.exam_id == exam.id).order_by(ExamQuestion.position)
+    )
+    rows = result.all()
+    if not rows:
+        raise ValueError(f"Exam {exam.id} has no stored questions to render from")
+    exam_config = await session.get(ExamConfig, exam.exam_config_id)
+
+    questions_by_id = await _load_questions(session, {row.question_id for row in rows if row.question_id})
+    questions = []
+    chosen_opts = {}
+    for row in rows:
+        question = questions_by_id.get(row.question_id)
+        if question is None:
+            raise ValueError(f"Question {row.position} of exam {exam.id} no longer exists")
+        opts_by_id = {opt.id: opt for opt in question.question_options}
+        questions.append(question)
+        chosen_opts[question.id] = [opts_by_id[opt_id] for opt_id in row.option_ids if opt_id in opts_by_id]
+
+    render_questions, answers_map = _render_questions(questions, [row.weight for row in rows], chosen_opts)
+    return render_questions, answers_map, exam_config
+
+
+async def get_answer_key(session: AsyncSession, exam_id: int) -> Tuple[List[str], List[float]]:
+    """Correct letter and weight of every question of an exam, in exam order."""
+    result = await session.exec(
+        select(ExamQuestion.answer, ExamQuestion.weight)
+        .where(ExamQuestion.exam_id == exam_id)
+        .order_by(ExamQuestion.position)
+    )
+    rows = result.all()
+    return [answer for answer, _ in rows], [weight for _, weight in rows]
+
+
+async def render_exam_latex(session: AsyncSession, exam_id: int) -> Tuple[str, Dict[int, str], List[float]] | None:
+    """Produce a stored variant's questions LaTeX, answer map and question weights on demand.
+
+    The output matches what was generated as long as the selected questions
+    and options have not been edited since.
+    """
+    exam = await session.get(Exam, exam_id)
+    if not exam:
+        return None
+
+    render_questions, answers_map, _ = await _load_exam_questions(session, exam)
+    return questions_latex(render_questions), answers_map, [question.weight for question in render_questions]
+
+
+async def render_exam_pdf(session: AsyncSession, exam_id: int) -> bytes | None:
+    """Render the PDF of a single stored variant without regenerating its batch."""
+    exam = await session.get(Exam, exam_id)
+    if not exam:
+        return None
+    render_questions, _, exam_config = await _load_exam_questions(session, exam)
+    if exam.template_version and exam.template_version != template_registry.version:
+        logger.warning(f"Exam {exam_id} was generated with templates {exam.template_version}, rendering with {template_registry.version}")
+
+    subject = await session.get(Subject, exam_config.subject_id)
+    header = DocumentHeader(
+        subject.name if subject else "Unknown Subject",
+        exam_config.semester or "1",
+        exam_config.academic_year or "2025/26",
+        exam_config.exam_title or "Exame Época Normal",
+        _format_exam_date(exam_config.exam_date) if exam_config.exam_date else None,
+    )
+    document = VariantDocument(header, exam.variant_number or 1, exam_config.fraction, render_questions)
+    # Release the connection before rendering
+    await session.commit()
+
+    return await select_renderer([document]).render_variant(document)
+
+
+async def get_exam_pdf_path(session: AsyncSession, exam_id: int) -> Tuple[str, str] | None:
+    """Path and content hash of a stored exam's PDF.
+
+    The PDF is rendered on first access and kept in the blob store, so
+    later reads only touch the file.
+    """
+    exam = await session.get(Exam, exam_id)
+    if not exam:
+        return None
+    if exam.pdf_sha256:
+        path = pdf_store.existing_path(exam.pdf_sha256)
+        if path:
+            return path, exam.pdf_sha256
+
+    pdf = await render_exam_pdf(session, exam_id)
+    if pdf is None:
+        raise RuntimeError(f"Rendering exam {exam_id} failed. Check logs for details.")
+    digest = await asyncio.to_thread(pdf_store.put, pdf)
+
+    exam.pdf_sha256 = digest
+    session.add(exam)
+    await session.commit()
+    return pdf_store.path_for(digest), digest
+
+
+def _compile_workers() -> int:
+    """Number of pdflatex processes a single generation may run at once."""
+    return settings.LATEX_MAX_WORKERS or os.cpu_count() or 1
+
+
+def _format_exam_date(exam_date: str) -> str:
+    """Format a YYYY-MM-DD date in Portuguese, e.g. '15 de janeiro de 2026'."""
+    from datetime import datetime
+    date_obj = datetime.strptime(exam_date, "%Y-%m-%d")
+    formatted_date = date_obj.strftime("%d de %B de %Y")
+    # Portuguese month names
+    pt_months = {
+        "January": "janeiro", "February": "fevereiro", "March": "março",
+        "April": "abril", "May": "maio", "June": "junho",
+        "July": "julho", "August": "agosto", "September": "setembro",
+        "October": "outubro", "November": "novembro", "December": "dezembro"
+    }
+    for en, pt in pt_months.items():
+        formatted_date = formatted_date.replace(en, pt)
+    return formatted_date
+
+
+def _write_zip_entry(zf, name: str, data: bytes):
+    """Add a file to the ZIP with a fixed timestamp."""
+    import zipfile
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    zf.writestr(info, data)
+
+
+def _generate_questions(questions: list, topic_weights: Dict[int, float], opts_by_q: Dict[int, list], num_options: int = 4, rng: random.Random = None) -> Tuple[List[RenderQuestion], Dict[int, str], List[ExamQuestion]]:
+    """Lay out questions with random options, return them with the answer map and the exam_question rows."""
+    rng = rng or random.Random()
+    chosen_opts = {q.id: _choose_options(opts_by_q.get(q.id, []), rng, num_options) for q in questions}
+    weights = [topic_weights.get(q.topic_id, 1.0) for q in questions]
+    render_questions, answers_map = _render_questions(questions, weights, chosen_opts)
+    exam_questions = [
+        ExamQuestion(
+            position=q_num,
+            question_id=q.id,
+            option_ids=[opt.id for opt in chosen_opts[q.id]],
+            answer=answers_map.get(q_num, ""),
+            weight=weight,
         )
-        pdf_path = os.path.join(workdir, main_file.replace(".tex", ".pdf"))
-        if os.path.exists(pdf_path):
-            with open(pdf_path, "rb") as f:
-                return f.read()
-    except Exception as e:
-        logger.error(f"LaTeX compilation failed: {e}")
-    return None
+        for q_num, (q, weight) in enumerate(zip(questions, weights), 1)
+    ]
+    return render_questions, answers_map, exam_questions
+
+
+def _choose_options(all_opts: list, rng: random.Random, num_options: int = 4) -> list:
+    """Pick one correct and up to num_options - 1 wrong options, in display order."""
+    # Sort first so the same seed always yields the same choice
+    all_opts = sorted(all_opts, key=lambda o: o.id)
+    correct_opts = [o for o in all_opts if o.value]
+    wrong_opts = [o for o in all_opts if not o.value]
+
+    # Pick one correct option
+    correct = correct_opts[0] if correct_opts else None
+
+    # Fill wrong options up to num_options - 1
+    rng.shuffle(wrong_opts)
+    selected_wrong = wrong_opts[:num_options - 1]
+
+    # Build final options list
+    final_opts = ([correct] if correct else []) + selected_wrong
+    rng.shuffle(final_opts)
+    return final_opts
+
+
+def _render_questions(questions: list, weights: List[float], chosen_opts: Dict[int, list]) -> Tuple[List[RenderQuestion], Dict[int, str]]:
+    """Pair questions with their already chosen options and weights, return them and the answer map."""
+    render_questions = []
+    answers_map = {}
+
+    for q_num, (q, weight) in enumerate(zip(questions, weights), 1):
+        options = []
+        for i, opt in enumerate(chosen_opts.get(q.id, [])):
+            if opt.value:
+                answers_map[q_num] = chr(ord('A') + i)
+            options.append(RenderOption(opt.option_text, bool(opt.value), opt.latex_text))
+        render_questions.append(RenderQuestion(q.question_text, weight, options, q.latex_text))
+
+    return render_questions, answers_map
+
+
+async def _reuse_configs(session: AsyncSession, exam_config_id: int) -> Tuple[ExamConfig, List[TopicConfig]]:
+    """Load a config created earlier, deleting the exams an interrupted generation saved for it."""
+    exam_config = await session.get(ExamConfig, exam_config_id)
+    if exam_config is None:
+        raise ValueError(f"Exam config {exam_config_id} not found")
+    result = await session.exec(
+        select(TopicConfig).where(TopicConfig.exam_config_id == exam_config_id).order_by(TopicConfig.id)
+    )
+    topic_configs = list(result.all())
+    # exam_question and question_usage rows go with them (ON DELETE CASCADE)
+    await session.execute(delete(Exam).where(Exam.exam_config_id == exam_config_id))
+    await session.commit()
+    return exam_config, topic_configs
 
 
 async def create_configs_and_exams(
     session: AsyncSession,
     exam_specs: dict,
-    num_variations: int = 1
-) -> bytes:
-    """Backward-compatible function combining config creation and exam generation."""
-    exam_config, topic_configs = await create_configs(session, exam_specs)
+    num_variations: int = 1,
+    is_disconnected=None,
+    exam_config_id: int = None
+) -> AsyncIterator[bytes]:
+    """Backward-compatible function combining config creation and exam generation.
+
+    With exam_config_id the configs created by an earlier attempt are
+    generated again instead of creating new ones.
+    """
+    # Checked before any config is saved
+    if num_variations < 1:
+        raise ValueError(f"num_variations must be at least 1, got {num_variations}")
+    if exam_config_id is None:
+        exam_config, topic_configs = await create_configs(session, exam_specs)
+    else:
+        exam_config, topic_configs = await _reuse_configs(session, exam_config_id)
     exam_title = exam_specs.get("exam_title", "Exame Época Normal")
     exam_date = exam_specs.get("exam_date")
     semester = exam_specs.get("semester", "1")
     academic_year = exam_specs.get("academic_year", "2025/26")
-    return await generate_exams_from_configs(session, exam_config, topic_configs, num_variations, exam_title, exam_date, semester, academic_year)
+    seed = exam_specs.get("seed")
+    single_document = exam_specs.get("single_document")
+    return await generate_exams_from_configs(session, exam_config, topic_configs, num_variations, exam_title, exam_date, semester, academic_year, seed, single_document, is_disconnected)
+
+
+async def generate_with_admission(
+    session: AsyncSession,
+    exam_specs: dict,
+    num_variations: int,
+    caller: str,
+    is_disconnected=None,
+    bounded: bool = True,
+    exam_config_id: int = None
+) -> AsyncIterator[bytes]:
+    """create_configs_and_exams once the admission controller grants a generation slot.
+
+    Requests queue fairly per caller and subject; with bounded, a full queue
+    raises QueueFull. The slot is held until the returned ZIP stream ends.
+    A client that disconnects while queued gets an empty stream.
+    """
+    wait = await generation_admission.acquire((caller, exam_specs.get("subject_id")), bounded, is_disconnected)
+    if wait is None:
+        logger.info("Client disconnected while queued for generation")
+        return _empty_stream()
+    if wait:
+        logger.info(f"Generation admitted after waiting {wait:.1f}s")
+    try:
+        zip_stream = await create_configs_and_exams(session, exam_specs, num_variations, is_disconnected, exam_config_id)
+    except BaseException:
+        generation_admission.release()
+        raise
+    return AdmittedStream(generation_admission, zip_stream)
+
+
+async def _empty_stream() -> AsyncIterator[bytes]:
+    return
+    yield
 
 
 async def get_exam_configs_by_subject(
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+from contextlib import aclosing
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import or_, and_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.db import async_session
+from src.core.settings import settings
+from src.models.exam_job import ExamJob, ExamJobStatus, utcnow
+from src.services import exam as exam_service
+from src.services.single_flight import request_key
+
+logger = logging.getLogger(__name__)
+
+# Set on submit so a local worker starts right away instead of waiting for the next poll
+_job_available = asyncio.Event()
+# Keeps two identical submissions to this process from both missing each other
+_submit_lock = asyncio.Lock()
+
+
+async def submit_job(session: AsyncSession, exam_specs: dict, caller: str = "") -> ExamJob:
+    """Queue an exam generation job and return it immediately.
+
+    Resubmitting the same specs as the same caller returns the job already
+    queued or running for them, or the one that finished within
+    SINGLE_FLIGHT_WINDOW_SECONDS, instead of queueing another.
+    """
+    key = request_key(exam_specs, caller)
+    async with _submit_lock:
+        finished_after = utcnow() - timedelta(seconds=settings.SINGLE_FLIGHT_WINDOW_SECONDS)
+        result = await session.exec(
+            select(ExamJob)
+            .where(
+                ExamJob.request_key == key,
+                or_(
+                    ExamJob.status.in_([ExamJobStatus.PENDING, ExamJobStatus.RUNNING]),
+                    and_(ExamJob.status == ExamJobStatus.DONE, ExamJob.updated_at >= finished_after),
+                ),
+            )
+            .order_by(ExamJob.created_at.desc())
+            .limit(1)
+        )
+        existing = result.first()
+        if existing:
+            logger.info(f"Returning exam job {existing.id} for a duplicate submission")
+            return existing
+
+        job = ExamJob(exam_specs=exam_specs, num_variations=exam_specs.get("num_variations", 1), request_key=key)
+        session.add(job)
+        await session.commit()
+        await session.refresh(job)
+    _job_available.set()
+    return job
+
+
+async def get_job(session: AsyncSession, job_id: str) -> Optional[ExamJob]:
+    """Get a job by its ID"""
+    return await session.get(ExamJob, job_id)
+
+
+async def _claim_next_job() -> Optional[ExamJob]:
+    """Atomically mark the oldest runnable job as running and return it.
+
+    Running jobs whose heartbeat went stale belonged to a worker that died,
+    so they are picked up again.
+    """
+    stale_before = utcnow() - timedelta(seconds=settings.EXAM_JOB_STALE_SECONDS)
+    async with async_session() as session:
+        result = await session.exec(
+            select(ExamJob)
+            .where(or_(
+                ExamJob.status == ExamJobStatus.PENDING,
+                and_(ExamJob.status == ExamJobStatus.RUNNING, ExamJob.updated_at < stale_before),
+            ))
+            .order_by(ExamJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = result.first()
+        if not job:
+            return None
+        job.status = ExamJobStatus.RUNNING
+        job.updated_at = utcnow()
+        session.add(job)
+        await session.commit()
+        return job
+
+
+async def _set_job_state(job_id: str, **values):
+    async with async_session() as session:
+        await session.execute(
+            update(ExamJob).where(ExamJob.id == job_id).values(updated_at=utcnow(), **values)
+        )
+        await session.commit()
+
+
+async def _heartbeat(job_id: str):
+    """Keep updated_at fresh so other workers do not treat the job as abandoned."""
+    interval = max(settings.EXAM_JOB_STALE_SECONDS // 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        await _set_job_state(job_id)
+
+
+async def _run_job(job: ExamJob):
+    logger.info(f"Running exam job {job.id} ({job.num_variations} variations)")
+    heartbeat = asyncio.create_task(_heartbeat(job.id))
+    result_path = os.path.join(settings.EXAM_JOBS_DIR, f"{job.id}.zip")
+    partial_path = f"{result_path}.part"
+    try:
+        os.makedirs(settings.EXAM_JOBS_DIR, exist_ok=True)
+        async with async_session() as session:
+            # Retries generate the config the first attempt created
+            if job.exam_config_id is None:
+                exam_config, _ = await exam_service.create_configs(session, job.exam_specs)
+                job.exam_config_id = exam_config.id
+                await _set_job_state(job.id, exam_config_id=exam_config.id)
+            # Jobs are already queued, so they wait for a slot however long the queue is
+            zip_stream = await exam_service.generate_with_admission(
+                session, job.exam_specs, job.num_variations, "jobs", bounded=False, exam_config_id=job.exam_config_id
+            )
+            # aclosing stops the compiles and removes saved exams if the worker is cancelled
+            async with aclosing(zip_stream):
+                with open(partial_path, "wb") as f:
+                    async for chunk in zip_stream:
+                        await asyncio.to_thread(f.write, chunk)
+        os.replace(partial_path, result_path)
+
+        await _set_job_state(job.id, status=ExamJobStatus.DONE, result_path=result_path, error=None)
+        logger.info(f"Exam job {job.id} finished")
+    except asyncio.CancelledError:
+        # Worker shutting down: hand the job back to the queue
+        await _set_job_state(job.id, status=ExamJobStatus.PENDING)
+        raise
+    except Exception as e:
+        logger.error(f"Exam job {job.id} failed: {e}")
+        await _set_job_state(job.id, status=ExamJobStatus.FAILED, error=str(e))
+    finally:
+        heartbeat.cancel()
+        # Left behind when the job failed or was interrupted
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+
+
+async def run_worker():
+    """Consume queued jobs until cancelled."""
+    while True:
+        _job_available.clear()
+        try:
+            job = await _claim_next_job()
+        except Exception as e:
+            logger.error(f"Failed to claim exam job: {e}")
+            job = None
+
+        if job:
+            await _run_job(job)
+            continue
+
+        try:
+            await asyncio.wait_for(_job_available.wait(), settings.EXAM_JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
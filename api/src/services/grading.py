@@ -0,0 +1,112 @@
+import csv
+import io
+import logging
+from typing import List, Tuple
+import numpy as np
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.models.exam import Exam, ExamGradingResult, StudentGrade
+from src.models.exam_config import ExamConfig
+from src.services import exam as exam_service
+
+logger = logging.getLogger(__name__)
+
+OPTION_LETTERS = "ABCD"
+UNANSWERED = -1
+
+
+def encode_answers(answers, num_questions: int) -> np.ndarray:
+    """Turn rows of option letters into an int8 matrix of option indexes.
+
+    Anything that is not one of OPTION_LETTERS (blank, cancelled, "X") is
+    UNANSWERED. Raises ValueError if a row does not have num_questions cells.
+    """
+    if not len(answers):
+        return np.empty((0, num_questions), dtype=np.int8)
+    for row_num, row in enumerate(answers, 1):
+        if len(row) != num_questions:
+            raise ValueError(f"Row {row_num} has {len(row)} answers, the exam has {num_questions} questions")
+
+    letters = np.char.upper(np.char.strip(np.asarray(answers, dtype=str)))
+    codes = np.full(letters.shape, UNANSWERED, dtype=np.int8)
+    for code, letter in enumerate(OPTION_LETTERS):
+        codes[letters == letter] = code
+    return codes
+
+
+def parse_responses_csv(content: str) -> Tuple[List[str], List[List[str]]]:
+    """Parse a CSV with one student per row: the student id, then one answer per question.
+
+    A first row whose id cell is "student" or "student_id" is treated as a header.
+    """
+    rows = [row for row in csv.reader(io.StringIO(content)) if row]
+    if rows and rows[0][0].strip().lower() in ("student", "student_id"):
+        rows = rows[1:]
+    students = [row[0].strip() for row in rows]
+    answers = [row[1:] for row in rows]
+    return students, answers
+
+
+def score_responses(answer_key: np.ndarray, weights: np.ndarray, responses: np.ndarray, fraction: int) -> dict:
+    """Score every student at once.
+
+    answer_key holds the correct option index per question, responses is a
+    students x questions matrix of option indexes. A wrong answer deducts
+    fraction percent of the question's weight; unanswered questions score
+    zero. Questions whose key is UNANSWERED have no correct option and are
+    voided: any answer to them scores zero and counts as neither correct
+    nor wrong.
+    """
+    voided = answer_key == UNANSWERED
+    answered = responses != UNANSWERED
+    correct = answered & ~voided & (responses == answer_key)
+    wrong = answered & ~voided & ~correct
+    penalty = fraction / 100.0
+    scores = correct @ weights - penalty * (wrong @ weights)
+    return {
+        "scores": scores,
+        "correct": correct.sum(axis=1),
+        "wrong": wrong.sum(axis=1),
+        "unanswered": (~answered).sum(axis=1),
+        "question_correct_rate": correct.mean(axis=0) if len(responses) else np.zeros(responses.shape[1]),
+        "voided": voided,
+    }
+
+
+async def grade_exam(session: AsyncSession, exam_id: int, students: List[str], answers: List[List[str]]) -> ExamGradingResult | None:
+    """Grade a batch of student responses to one exam variant."""
+    exam = await session.get(Exam, exam_id)
+    if not exam:
+        return None
+    if len(students) != len(answers):
+        raise ValueError(f"Got {len(students)} students but {len(answers)} rows of answers")
+
+    exam_config = await session.get(ExamConfig, exam.exam_config_id)
+    answer_key, weights = await exam_service.get_answer_key(session, exam.id)
+    if not answer_key:
+        raise ValueError(f"Exam {exam.id} has no stored answer key")
+
+    key = encode_answers([answer_key], len(answer_key))[0]
+    weights = np.asarray(weights, dtype=np.float64)
+    responses = encode_answers(answers, len(answer_key))
+    result = score_responses(key, weights, responses, exam_config.fraction)
+    voided_questions = (np.flatnonzero(result["voided"]) + 1).tolist()
+    if voided_questions:
+        logger.warning(f"Exam {exam_id} has no correct option for questions {voided_questions}, they are voided")
+    logger.info(f"Graded {len(students)} students on exam {exam_id}")
+
+    scores = np.round(result["scores"], 2).tolist()
+    grades = [
+        StudentGrade(student=student, score=score, correct=correct, wrong=wrong, unanswered=unanswered)
+        for student, score, correct, wrong, unanswered in zip(
+            students, scores, result["correct"].tolist(), result["wrong"].tolist(), result["unanswered"].tolist()
+        )
+    ]
+    return ExamGradingResult(
+        exam_id=exam.id,
+        variant_number=exam.variant_number,
+        max_score=round(float(weights[~result["voided"]].sum()), 2),
+        mean_score=round(float(result["scores"].mean()), 2) if grades else 0.0,
+        question_correct_rate=np.round(result["question_correct_rate"], 3).tolist(),
+        voided_questions=voided_questions,
+        grades=grades,
+    )
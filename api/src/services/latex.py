@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from src.core.settings import settings
+from src.services.pdf_cache import pdf_cache
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "..", "latex_templates")
+PREAMBLE_FILE = "preamble.tex"
+FORMAT_NAME = "exam_preamble"
+
+
+def _compile_slot_count() -> int:
+    """Number of pdflatex processes allowed to run at once in this worker."""
+    return settings.LATEX_COMPILE_SLOTS or os.cpu_count() or 1
+
+
+class CompileSlots:
+    """Semaphore for pdflatex runs that serves request compiles before background ones.
+
+    `async with compile_slots:` waits like asyncio.Semaphore; background()
+    only gets a slot that no request is waiting for.
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: deque[asyncio.Future] = deque()
+        self._background_waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self, background: bool = False):
+        if self._value > 0 and not self._waiters and not (background and self._background_waiters):
+            self._value -= 1
+            return
+        queue = self._background_waiters if background else self._waiters
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Handed a slot while being cancelled: pass it on
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+
+    def release(self):
+        self._value += 1
+        while self._value > 0:
+            queue = self._waiters or self._background_waiters
+            if not queue:
+                return
+            waiter = queue.popleft()
+            if not waiter.done():
+                self._value -= 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def background(self):
+        await self.acquire(background=True)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+# Shared by every request, so concurrent generations cannot oversubscribe the CPU
+compile_slots = CompileSlots(_compile_slot_count())
+
+_format_lock = threading.Lock()
+_format_checked = False
+_format_path: str | None = None
+
+
+def build_preamble_format(format_dir: str = None) -> str | None:
+    """Dump latex_templates/preamble.tex into a precompiled pdflatex format.
+
+    The format file name carries a hash of the preamble, so editing the
+    template never reuses a stale format. Returns the .fmt path, or None if
+    the dump failed.
+    """
+    format_dir = format_dir or settings.LATEX_FORMAT_DIR
+    preamble_path = os.path.join(TEMPLATES_DIR, PREAMBLE_FILE)
+    with open(preamble_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    fmt_path = os.path.abspath(os.path.join(format_dir, f"{FORMAT_NAME}-{digest}.fmt"))
+    if os.path.exists(fmt_path):
+        return fmt_path
+
+    os.makedirs(format_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shutil.copy(preamble_path, tmpdir)
+        try:
+            proc = subprocess.run(
+                ["pdflatex", "-ini", "-interaction=nonstopmode", f"-jobname={FORMAT_NAME}",
+                 "&pdflatex", f"{PREAMBLE_FILE}\\dump"],
+                cwd=tmpdir, capture_output=True, timeout=120
+            )
+        except Exception as e:
+            logger.warning(f"Could not build the LaTeX preamble format: {e}")
+            return None
+
+        built = os.path.join(tmpdir, f"{FORMAT_NAME}.fmt")
+        if not os.path.exists(built):
+            tail = proc.stdout.decode("utf-8", errors="replace")[-2000:]
+            logger.warning(f"Could not build the LaTeX preamble format:\n{tail}")
+            return None
+        # Copy next to the target first so concurrent builders never see a partial file
+        staging = f"{fmt_path}.{os.getpid()}.tmp"
+        shutil.copy(built, staging)
+        os.replace(staging, fmt_path)
+
+    logger.info(f"Built LaTeX preamble format {fmt_path}")
+    return fmt_path
+
+
+def preamble_format() -> str | None:
+    """Path of the precompiled preamble format, building it on first use.
+
+    Returns None when the format is unavailable; documents then load the
+    plain preamble.
+    """
+    global _format_checked, _format_path
+    with _format_lock:
+        if not _format_checked:
+            _format_path = build_preamble_format() if shutil.which("pdflatex") else None
+            _format_checked = True
+        return _format_path
+
+
+def _disable_preamble_format():
+    global _format_path
+    with _format_lock:
+        if _format_path:
+            logger.warning(f"Disabling LaTeX preamble format {_format_path}, falling back to the plain preamble")
+        _format_path = None
+
+
+def _pdflatex_invocation(main_file: str, fmt_path: str | None) -> tuple[list[str], dict | None]:
+    """Command line and environment for one pdflatex run."""
+    cmd = ["pdflatex", "-interaction=nonstopmode"]
+    env = None
+    if fmt_path:
+        fmt_dir, fmt_file = os.path.split(fmt_path)
+        cmd.append(f"-fmt={os.path.splitext(fmt_file)[0]}")
+        env = {**os.environ, "TEXFORMATS": f"{fmt_dir}{os.pathsep}"}
+    cmd.append(main_file)
+    return cmd, env
+
+
+def _read_pdf(workdir: str, main_file: str, output: bytes, returncode: int | None) -> bytes | None:
+    pdf_path = os.path.join(workdir, main_file.replace(".tex", ".pdf"))
+    if not os.path.exists(pdf_path):
+        tail = output.decode("utf-8", errors="replace")[-2000:]
+        logger.error(f"LaTeX compilation of {main_file} failed (exit {returncode}):\n{tail}")
+        return None
+    with open(pdf_path, "rb") as f:
+        return f.read()
+
+
+async def _run_once(workdir: str, main_file: str, fmt_path: str | None, timeout: float) -> bytes | None:
+    cmd, env = _pdflatex_invocation(main_file, fmt_path)
+    async with compile_slots:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=workdir,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        try:
+            output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            logger.error(f"LaTeX compilation of {main_file} timed out after {timeout}s")
+            return None
+        except asyncio.CancelledError:
+            # The request was abandoned: stop pdflatex now rather than let it finish
+            proc.kill()
+            raise
+    return _read_pdf(workdir, main_file, output, proc.returncode)
+
+
+async def run_pdflatex(workdir: str, main_file: str, timeout: float = None) -> bytes | None:
+    """Compile main_file inside workdir without blocking the event loop.
+
+    Identical inputs are served from the PDF cache without spawning pdflatex.
+    Otherwise uses the precompiled preamble format when available and retries
+    with the plain preamble if the format run fails. Returns the PDF bytes, or
+    None if compilation failed or timed out.
+    """
+    timeout = timeout or settings.LATEX_TIMEOUT
+    cache_key = None
+    if pdf_cache.enabled:
+        # Hashing the inputs and reading, writing or evicting cached PDFs is disk work
+        cache_key = await asyncio.to_thread(pdf_cache.key_for, workdir, main_file)
+        cached = await asyncio.to_thread(pdf_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+    fmt_path = _format_path if _format_checked else await asyncio.to_thread(preamble_format)
+
+    pdf = await _run_once(workdir, main_file, fmt_path, timeout)
+    if pdf is None and fmt_path:
+        pdf = await _run_once(workdir, main_file, None, timeout)
+        if pdf is not None:
+            _disable_preamble_format()
+
+    if pdf is not None and cache_key:
+        await asyncio.to_thread(pdf_cache.put, cache_key, pdf)
+    return pdf
+
+
+async def _check_once(workdir: str, main_file: str, fmt_path: str | None, timeout: float) -> bool | None:
+    cmd, env = _pdflatex_invocation(main_file, fmt_path)
+    cmd.insert(1, "-halt-on-error")
+    async with compile_slots.background():
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                cwd=workdir,
+                env=env,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except OSError as e:
+            logger.warning(f"LaTeX check of {main_file} could not start pdflatex: {e}")
+            return None
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            logger.warning(f"LaTeX check of {main_file} timed out after {timeout}s")
+            return None
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+    return proc.returncode == 0
+
+
+async def check_pdflatex(workdir: str, main_file: str, timeout: float = None) -> bool | None:
+    """Whether main_file compiles without a single LaTeX error, at background priority.
+
+    Unlike run_pdflatex, a PDF produced despite errors counts as a failure
+    and nothing is cached. Returns None when pdflatex timed out or could not
+    run, which says nothing about the document.
+    """
+    timeout = timeout or settings.LATEX_TIMEOUT
+    fmt_path = _format_path if _format_checked else await asyncio.to_thread(preamble_format)
+
+    ok = await _check_once(workdir, main_file, fmt_path, timeout)
+    if ok is False and fmt_path:
+        ok = await _check_once(workdir, main_file, None, timeout)
+        if ok:
+            _disable_preamble_format()
+    return ok
+
+
+def _run_once_sync(workdir: str, main_file: str, fmt_path: str | None, timeout: float) -> bytes | None:
+    cmd, env = _pdflatex_invocation(main_file, fmt_path)
+    try:
+        proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f"LaTeX compilation of {main_file} timed out after {timeout}s")
+        return None
+    return _read_pdf(workdir, main_file, proc.stdout, proc.returncode)
+
+
+def run_pdflatex_sync(workdir: str, main_file: str, timeout: float = None) -> bytes | None:
+    """Blocking counterpart of run_pdflatex for synchronous callers."""
+    timeout = timeout or settings.LATEX_TIMEOUT
+    cache_key = None
+    if pdf_cache.enabled:
+        cache_key = pdf_cache.key_for(workdir, main_file)
+        cached = pdf_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    fmt_path = preamble_format()
+
+    pdf = _run_once_sync(workdir, main_file, fmt_path, timeout)
+    if pdf is None and fmt_path:
+        pdf = _run_once_sync(workdir, main_file, None, timeout)
+        if pdf is not None:
+            _disable_preamble_format()
+
+    if pdf is not None and cache_key:
+        pdf_cache.put(cache_key, pdf)
+    return pdf
+
+
+if __name__ == "__main__":
+    # Build step for the Docker image: python -m src.services.latex
+    logging.basicConfig(level=logging.INFO)
+    if not build_preamble_format():
+        logger.warning("Preamble format not built; it will be retried on first use")
@@ -0,0 +1,362 @@
+import asyncio
+import io
+import logging
+import tempfile
+from typing import Dict, List
+from src.core.settings import settings
+from src.services.latex import check_pdflatex, run_pdflatex, run_pdflatex_sync
+from src.services.latex_text import latex_fragment
+from src.services.renderer import DocumentHeader, PdfRenderer, RenderQuestion, SolutionsDocument, VariantDocument
+from src.services.template_registry import template_registry
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Single-document mode falls back to one compile per variant
+    PdfReader = PdfWriter = None
+
+logger = logging.getLogger(__name__)
+
+
+def questions_latex(questions: List[RenderQuestion]) -> str:
+    """Render questions with their choices as T-variants.tex content.
+
+    Texts come from the fragments stored with each question and option and
+    are only escaped here when a fragment is missing.
+    """
+    lines = []
+
+    for question in questions:
+        lines.append("\\question")
+        lines.append(f"({question.weight:.2f} pts) {_fragment(question)}")
+        lines.append("\\nopagebreak")
+        lines.append("")
+
+        lines.append("\\begin{choices}")
+        for opt in question.options:
+            if opt.correct:
+                lines.append(f"  \\CorrectChoice {_fragment(opt)}")
+            else:
+                lines.append(f"  \\choice {_fragment(opt)}")
+        lines.append("\\end{choices}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def _fragment(item) -> str:
+    return item.latex if item.latex is not None else latex_fragment(item.text)
+
+
+def _document_files(header: DocumentHeader) -> Dict[str, str]:
+    """Render the inputs shared by every document of a batch: UC and date."""
+    files = {}
+    if header.subject_name:
+        files["UC.tex"] = _uc_latex(header)
+    if header.date_text:
+        files["date.tex"] = header.date_text
+    return files
+
+
+def _variant_files(document: VariantDocument) -> Dict[str, str]:
+    """Render the per-variant LaTeX inputs: main file, questions, rules and blank answer grid."""
+    footer = f"\\footer{{}}{{Page \\thepage\\ of \\numpages}}{{{document.footer}}}" if document.footer else ""
+    return {
+        **_document_files(document.header),
+        "main_variants.tex": template_registry.render(
+            "main_variants.tex",
+            VARIANT=document.variant_number,
+            EXAM_TITLE=document.header.exam_title,
+            FOOTER=footer,
+        ),
+        "T-variants.tex": questions_latex(document.questions),
+        "Rules.tex": _rules_latex(document.num_questions, document.fraction),
+        "T-answers.tex": _blank_answers_latex(document.num_questions),
+    }
+
+
+def _rules_latex(num_questions: int, fraction: int) -> str:
+    """Render Rules.tex with the number of questions and the wrong-answer penalty."""
+    return template_registry.render("Rules.tex", NUM_QUESTIONS=num_questions, FRACTION=fraction / 100.0)
+
+
+def _blank_answers_latex(num_questions: int) -> str:
+    """Render a blank T-answers.tex for the student exam."""
+    cols = num_questions
+    header = " &".join([f"{i:02d}" for i in range(1, cols + 1)])
+    
+    rows = []
+    for letter in ['A', 'B', 'C', 'D']:
+        cells = [" " for _ in range(1, cols + 1)]
+        rows.append(f"{letter}& " + " & ".join(cells) + " \\\\ \\hline")
+    
+    content = f"""\\renewcommand{{\\arraystretch}}{{1.5}}
+\\begin{{center}}
+\\begin{{minipage}}{{0.15\\textwidth}}
+\\qrcode[height=0.75in]{{\\tttnumber}}
+\\end{{minipage}}%
+\\begin{{minipage}}{{0.80\\textwidth}}
+\\scriptsize
+\\begin{{center}}
+\\begin{{tabular}}{{|l|{'l|' * cols}}}
+\\hline
+ &{header}\\\\ \\hline
+{chr(10).join(rows)}
+\end{{tabular}}
+\end{{center}}
+\\end{{minipage}}
+\\end{{center}}
+\\vspace{{0.25cm}}
+"""
+    return content
+
+
+def _answer_key_latex(answers: Dict[int, str], num_questions: int) -> str:
+    """Render T-answers.tex with X marks in correct cells."""
+    cols = num_questions
+    header = " &".join([f"{i:02d}" for i in range(1, cols + 1)])
+    
+    rows = []
+    for letter in ['A', 'B', 'C', 'D']:
+        cells = [("X" if answers.get(q) == letter else " ") for q in range(1, cols + 1)]
+        rows.append(f"{letter}& " + " & ".join(cells) + " \\\\ \\hline")
+    
+    content = f"""\\renewcommand{{\\arraystretch}}{{1.5}}
+\\begin{{center}}
+\\begin{{minipage}}{{0.15\\textwidth}}
+\\qrcode[height=0.75in]{{\\tttnumber}}
+\\end{{minipage}}%
+\\begin{{minipage}}{{0.80\\textwidth}}
+\\scriptsize
+\\begin{{center}}
+\\begin{{tabular}}{{|l|{'l|' * cols}}}
+\\hline
+ &{header}\\\\ \\hline
+{chr(10).join(rows)}
+\end{{tabular}}
+\end{{center}}
+\\end{{minipage}}
+\\end{{center}}
+\\vspace{{0.25cm}}
+"""
+    return content
+
+
+def _all_solutions_latex(document: SolutionsDocument) -> str:
+    """Render solutions.tex with all variations in horizontal lines."""
+    all_answers, num_questions, exam_title = document.answers, document.num_questions, document.header.exam_title
+    content = f"""\\input{{preamble}}
+\\input{{H}}
+\\begin{{document}}
+
+\\begin{{center}}
+\\huge
+\\input{{UC}}
+
+\\vspace{{0.3cm}}
+\\normalsize
+{exam_title}
+\\\\
+\\input{{date}}
+
+\\vspace{{0.5cm}}
+\\Large \\textbf{{Soluções}}
+\\end{{center}}
+
+\\vspace{{0.5cm}}
+
+"""
+    
+    for var_num in sorted(all_answers.keys()):
+        answers = all_answers[var_num]
+        cols = num_questions
+        header = " &".join([f"{i:02d}" for i in range(1, cols + 1)])
+        
+        rows = []
+        for letter in ['A', 'B', 'C', 'D']:
+            cells = [("X" if answers.get(q) == letter else " ") for q in range(1, cols + 1)]
+            rows.append(f"{letter}& " + " & ".join(cells) + " \\\\ \\hline")
+        
+        content += f"""\\noindent\\rule{{\\textwidth}}{{0.4pt}}
+
+\\vspace{{0.3cm}}
+
+\\begin{{center}}
+\\begin{{tabular}}{{c c}}
+\\textbf{{Version {var_num}}} &
+\\renewcommand{{\\arraystretch}}{{1.5}}
+\\begin{{minipage}}{{0.75\\textwidth}}
+\\scriptsize
+\\begin{{center}}
+\\begin{{tabular}}{{|l|{'l|' * cols}}}
+\\hline
+ &{header}\\\\ \\hline
+{chr(10).join(rows)}
+\\end{{tabular}}
+\\end{{center}}
+\\end{{minipage}}
+\\end{{tabular}}
+\\end{{center}}
+
+\\vspace{{0.3cm}}
+
+"""
+    
+    content += "\\end{document}"
+    return content
+
+
+def _uc_latex(header: DocumentHeader) -> str:
+    """Render the subject-specific UC.tex."""
+    subject_name, semester, academic_year = header.subject_name, header.semester, header.academic_year
+    semester_text_en = f"{semester}st Semester" if semester == "1" else f"{semester}nd Semester"
+    semester_text_pt = f"{semester}º Semestre"
+    return f"""\\iftoggle{{english}}{{
+{subject_name}\\\\
+{semester_text_en}, {academic_year}\\\\
+}}{{
+{subject_name}\\\\
+{semester_text_pt}, {academic_year}\\\\
+}}"""
+
+
+def _variants_document_files(documents: List[VariantDocument]) -> Dict[str, str]:
+    """Render a single document holding every variant as variants.tex.
+
+    Each variant resets \\tttnumber, the version header and the question
+    counter, and records a named PDF destination 'variant-N' on its first
+    page so the output can be split back into one PDF per variant.
+    """
+    first = documents[0]
+    exam_title = first.header.exam_title
+    files = {f"T-variants-{document.variant_number}.tex": questions_latex(document.questions) for document in documents}
+    # Rules.tex redefines \Rules, so every variant's header can input it again
+    files["Rules.tex"] = _rules_latex(first.num_questions, first.fraction)
+    files["T-answers.tex"] = _blank_answers_latex(first.num_questions)
+
+    lines = [
+        "\\input{preamble}",
+        "\\input{H}",
+        "\\newcommand\\tttnumber{0}",
+        "\\newcommand\\ExamVersion{0}",
+        "\\newcommand\\ExamVariantStart{}",
+        "\\begin{document}",
+        "",
+    ]
+    for var_num in (document.variant_number for document in documents):
+        lines += [
+            f"\\renewcommand\\tttnumber{{{var_num}}}",
+            f"\\renewcommand\\ExamVersion{{{var_num}}}",
+            f"\\renewcommand\\ExamVariantStart{{\\pdfdest name{{variant-{var_num}}} xyz\\relax}}",
+            "\\setcounter{question}{0}",
+            f"\\Header{{{exam_title}}}{{\\Rules}}{{T-answers}}{{extra}}",
+            "\\begin{questions}",
+            f"\\input{{T-variants-{var_num}}}",
+            "\\end{questions}",
+            "",
+        ]
+    lines.append("\\end{document}")
+    files["variants.tex"] = "\n".join(lines)
+    return files
+
+
+def _check_document_files(questions: List[RenderQuestion]) -> Dict[str, str]:
+    """A bare document with just the questions, to find out whether they compile.
+
+    Without questions it holds an empty page, which checks pdflatex itself.
+    """
+    body = ["\\begin{questions}", "\\input{T-check}", "\\end{questions}"] if questions else ["\\mbox{}"]
+    return {
+        "T-check.tex": questions_latex(questions),
+        "check.tex": "\n".join(["\\input{preamble}", "\\begin{document}", *body, "\\end{document}"]),
+    }
+
+
+def _split_variants_pdf(pdf: bytes, variant_numbers: List[int]) -> Dict[int, bytes] | None:
+    """Split the single-document PDF at its 'variant-N' destinations."""
+    reader = PdfReader(io.BytesIO(pdf))
+    destinations = reader.named_destinations
+    starts = []
+    for var_num in variant_numbers:
+        dest = destinations.get(f"variant-{var_num}")
+        if dest is None:
+            logger.error(f"Page marker for variant {var_num} is missing")
+            return None
+        starts.append(reader.get_destination_page_number(dest))
+    if starts != sorted(starts) or len(set(starts)) != len(starts):
+        logger.error(f"Variant page markers are out of order: {starts}")
+        return None
+
+    pdfs = {}
+    ends = starts[1:] + [len(reader.pages)]
+    for var_num, start, end in zip(variant_numbers, starts, ends):
+        writer = PdfWriter()
+        for page_index in range(start, end):
+            writer.add_page(reader.pages[page_index])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pdfs[var_num] = buffer.getvalue()
+    return pdfs
+
+
+def _prepare_workdir(root: str, name: str, files: Dict[str, str]) -> str:
+    """Create a scratch directory holding the templates and the given rendered files."""
+    workdir = tempfile.mkdtemp(prefix=f"{name}_", dir=root)
+    template_registry.write_workdir(workdir, files)
+    return workdir
+
+
+class LatexRenderer(PdfRenderer):
+    """Renders documents from the .tex templates with pdflatex."""
+
+    name = "latex"
+
+    def __init__(self, scratch_dir: str = None):
+        # Working directories go here; None means a temporary directory per document
+        self.scratch_dir = scratch_dir
+
+    async def _compile(self, name: str, files: Dict[str, str], main_file: str, timeout: float = None) -> bytes | None:
+        if self.scratch_dir:
+            return await run_pdflatex(_prepare_workdir(self.scratch_dir, name, files), main_file, timeout)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            return await run_pdflatex(_prepare_workdir(tmpdir, name, files), main_file, timeout)
+
+    async def render_variant(self, document: VariantDocument) -> bytes | None:
+        return await self._compile(f"var_{document.variant_number}", _variant_files(document), "main_variants.tex")
+
+    def render_variant_sync(self, document: VariantDocument) -> bytes | None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            workdir = _prepare_workdir(tmpdir, f"var_{document.variant_number}", _variant_files(document))
+            return run_pdflatex_sync(workdir, "main_variants.tex")
+
+    async def render_solutions(self, document: SolutionsDocument) -> bytes | None:
+        files = {**_document_files(document.header), "solutions.tex": _all_solutions_latex(document)}
+        return await self._compile("solutions", files, "solutions.tex")
+
+    async def check_questions(self, questions: List[RenderQuestion]) -> bool | None:
+        """Whether the questions compile together without any LaTeX error; None if the check was inconclusive."""
+        timeout = settings.LATEX_TIMEOUT * max(1, len(questions) // 50)
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as tmpdir:
+            workdir = _prepare_workdir(tmpdir, "check", _check_document_files(questions))
+            return await check_pdflatex(workdir, "check.tex", timeout)
+
+    async def render_variants(self, documents: List[VariantDocument]) -> Dict[int, bytes] | None:
+        """Compile every variant as one document in a single pdflatex run and split the result.
+
+        Returns None if pypdf is unavailable or the run failed, in which case
+        the caller renders the variants separately.
+        """
+        if PdfReader is None:
+            logger.warning("pypdf is not installed, single-document compilation is unavailable")
+            return None
+
+        files = {**_document_files(documents[0].header), **_variants_document_files(documents)}
+        timeout = settings.LATEX_TIMEOUT * len(documents)
+        pdf = await self._compile("variants", files, "variants.tex", timeout)
+        if pdf is None:
+            return None
+        try:
+            # Parsing and rewriting a PDF of many variants would hold the event loop for the whole split
+            return await asyncio.to_thread(_split_variants_pdf, pdf, [document.variant_number for document in documents])
+        except Exception as e:
+            logger.error(f"Could not split the single-document PDF: {e}")
+            return None
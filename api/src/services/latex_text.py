@@ -0,0 +1,32 @@
+import re
+
+# Inline and display math, kept exactly as written: $...$, $$...$$, \(...\), \[...\]
+MATH = re.compile(r"(?<!\\)(\$\$?).+?(?<!\\)\1|\\\(.+?\\\)|\\\[.+?\\\]", re.S)
+# Characters that break a compile when unescaped, in math and in running text
+SPECIAL = re.compile(r"(?<!\\)([%#])")
+TEXT_SPECIAL = re.compile(r"(?<!\\)([%#&_])")
+BLANK_LINES = re.compile(r"\n[ \t]*(?:\n[ \t]*)+")
+SPACES = re.compile(r"[ \t]+")
+
+
+def latex_fragment(text: str) -> str:
+    """Question or option text as LaTeX that is safe to splice into a template.
+
+    Line endings and runs of spaces are normalized, % and # are escaped
+    everywhere and & and _ outside math. Other markup (commands, groups,
+    math) is kept, so questions can still use TeX on purpose.
+
+    Command arguments are not math, so they are escaped too:
+    \\textbf{a_b} prints a_b, and names such as \\label or file arguments
+    cannot contain _ or &.
+    """
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    text = BLANK_LINES.sub("\n\n", SPACES.sub(" ", text)).strip()
+    out = []
+    pos = 0
+    for match in MATH.finditer(text):
+        out.append(TEXT_SPECIAL.sub(r"\\\1", text[pos:match.start()]))
+        out.append(SPECIAL.sub(r"\\\1", match.group(0)))
+        pos = match.end()
+    out.append(TEXT_SPECIAL.sub(r"\\\1", text[pos:]))
+    return "".join(out)
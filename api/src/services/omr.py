@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+import numpy as np
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.settings import settings
+from src.models.exam import Exam, OmrGradingResult, OmrSheet
+from src.models.exam_question import ExamQuestion
+from src.services import grading
+
+try:
+    import cv2
+except ImportError:  # Checked in read_scans
+    cv2 = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # Only needed for PDF scans
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+# Share of dark pixels inside a cell (borders excluded)
+EMPTY_MAX_INK = 0.06  # At most this much ink: the cell is empty
+CANCELLED_MIN_INK = 0.45  # At least this much: the cell was filled in to cancel it
+# In between the cell holds a mark (the X)
+
+EMPTY, MARKED, CANCELLED = 0, 1, 2
+
+# Rows in the answer table: the header plus one per option
+GRID_ROWS = len(grading.OPTION_LETTERS) + 1
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _omr_workers() -> int:
+    return settings.OMR_WORKERS or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: a fork of the running server would copy its event loop and threads
+        _pool = ProcessPoolExecutor(max_workers=_omr_workers(), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def list_pages(path: str) -> List[Tuple[str, int | None]]:
+    """Pages to read from a PDF file or from a directory of images (or PDFs).
+
+    Each page is (file path, page index), the index being None for images.
+    """
+    if os.path.isdir(path):
+        pages = []
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith((".pdf",) + IMAGE_EXTENSIONS):
+                pages.extend(list_pages(os.path.join(path, name)))
+        return pages
+    if path.lower().endswith(".pdf"):
+        if pdfium is None:
+            raise RuntimeError("pypdfium2 is not installed, PDF scans cannot be read")
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return [(path, index) for index in range(len(pdf))]
+        finally:
+            pdf.close()
+    return [(path, None)]
+
+
+def _load_page(path: str, page_index: int | None) -> np.ndarray:
+    """Grayscale image of one scanned page."""
+    if page_index is None:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError("Unreadable image")
+        return image
+
+    pdf = pdfium.PdfDocument(path)
+    try:
+        bitmap = pdf[page_index].render(scale=settings.OMR_DPI / 72, grayscale=True)
+        image = bitmap.to_numpy()
+    finally:
+        pdf.close()
+    return image[..., 0] if image.ndim == 3 else image
+
+
+def _line_centers(profile: np.ndarray, threshold: float) -> List[int]:
+    """Centers of the runs where profile is at least threshold."""
+    hits = np.flatnonzero(profile >= threshold)
+    if not len(hits):
+        return []
+    runs = np.split(hits, np.flatnonzero(np.diff(hits) > 1) + 1)
+    return [int(run.mean()) for run in runs]
+
+
+def locate_grid(ink: np.ndarray) -> Tuple[List[int], List[int]]:
+    """Find the answer table's horizontal and vertical lines in an ink mask.
+
+    Long straight strokes are isolated with a morphological opening, and
+    only lines crossed by at least three others are kept, which drops text
+    and the surrounding frame. The table has a header row plus one row per
+    option and a letter column plus one column per question, so it yields
+    GRID_ROWS + 1 horizontal lines and num_questions + 2 vertical ones.
+    """
+    height, width = ink.shape
+    horizontal = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(width // 10, 10), 1)))
+    vertical = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(height // 4, 10))))
+    crossings = cv2.bitwise_and(horizontal, vertical)
+
+    rows = [
+        row for row in _line_centers(horizontal.sum(axis=1), 1)
+        if len(_line_centers(crossings[max(row - 3, 0):row + 4].max(axis=0), 1)) >= 3
+    ]
+    cols = [
+        col for col in _line_centers(vertical.sum(axis=0), 1)
+        if len(_line_centers(crossings[:, max(col - 3, 0):col + 4].max(axis=1), 1)) >= 3
+    ]
+    if len(rows) != GRID_ROWS + 1 or len(cols) < 3:
+        raise ValueError(f"Answer grid not found ({len(rows)} rows and {len(cols)} columns of lines)")
+    return rows, cols
+
+
+def classify_cells(ink: np.ndarray, rows: List[int], cols: List[int]) -> np.ndarray:
+    """Options x questions matrix of EMPTY, MARKED or CANCELLED.
+
+    The header row and the letter column are skipped; each cell is judged
+    on its inner part so the table borders do not count as ink.
+    """
+    option_rows = list(zip(rows[1:-1], rows[2:]))
+    question_cols = list(zip(cols[1:-1], cols[2:]))
+    fill = np.zeros((len(option_rows), len(question_cols)))
+    for i, (top, bottom) in enumerate(option_rows):
+        margin_y = max((bottom - top) // 5, 1)
+        for j, (left, right) in enumerate(question_cols):
+            margin_x = max((right - left) // 5, 1)
+            fill[i, j] = ink[top + margin_y:bottom - margin_y, left + margin_x:right - margin_x].mean()
+
+    states = np.full(fill.shape, MARKED, dtype=np.int8)
+    states[fill <= EMPTY_MAX_INK] = EMPTY
+    states[fill >= CANCELLED_MIN_INK] = CANCELLED
+    return states
+
+
+def answers_from_cells(states: np.ndarray) -> List[str]:
+    """One letter per question; "" when nothing or more than one option is marked."""
+    marked = states == MARKED
+    single = marked.sum(axis=0) == 1
+    chosen = marked.argmax(axis=0)
+    letters = np.array(list(grading.OPTION_LETTERS[:states.shape[0]]))
+    return np.where(single, letters[chosen], "").tolist()
+
+
+def read_sheet(path: str, page_index: int | None) -> dict:
+    """Read one answer sheet: variant number from the QR code and the marked answers.
+
+    Runs in a worker process, so it only takes and returns plain data.
+    """
+    sheet = os.path.basename(path) if page_index is None else f"{os.path.basename(path)}#{page_index + 1}"
+    try:
+        image = _load_page(path, page_index)
+        text, points, _ = cv2.QRCodeDetector().detectAndDecode(image)
+        if not text or points is None:
+            raise ValueError("QR code not found")
+        variant_number = int(text.strip())
+
+        # The grid sits to the right of the QR code, roughly level with it
+        points = points.reshape(-1, 2)
+        qr_top, qr_bottom = int(points[:, 1].min()), int(points[:, 1].max())
+        qr_right = int(points[:, 0].max())
+        height = qr_bottom - qr_top
+        region = image[max(qr_top - height, 0):qr_bottom + height, qr_right:]
+        _, ink = cv2.threshold(region, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+        rows, cols = locate_grid(ink)
+        answers = answers_from_cells(classify_cells(ink, rows, cols))
+        return {"sheet": sheet, "variant_number": variant_number, "answers": answers, "error": None}
+    except Exception as e:
+        return {"sheet": sheet, "variant_number": None, "answers": [], "error": str(e)}
+
+
+async def read_scans(path: str) -> List[OmrSheet]:
+    """Read every page of a scanned PDF or directory of images on the process pool."""
+    if cv2 is None:
+        raise RuntimeError("opencv-python-headless is not installed, scans cannot be read")
+    pages = await asyncio.to_thread(list_pages, path)
+    if not pages:
+        raise ValueError("No scanned pages found")
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, read_sheet, page_path, page_index)
+        for page_path, page_index in pages
+    ))
+    sheets = [OmrSheet(**result) for result in results]
+    failed = sum(1 for sheet in sheets if sheet.error)
+    logger.info(f"Read {len(sheets)} answer sheets ({failed} unreadable)")
+    return sheets
+
+
+async def grade_scans(session: AsyncSession, exam_config_id: int, path: str) -> OmrGradingResult:
+    """Read scanned answer sheets and grade them against their variants' answer keys."""
+    sheets = await read_scans(path)
+
+    result = await session.exec(select(Exam).where(Exam.exam_config_id == exam_config_id))
+    exams_by_variant = {exam.variant_number: exam for exam in result.all()}
+
+    by_variant = {}
+    for sheet in sheets:
+        if sheet.error:
+            continue
+        exam = exams_by_variant.get(sheet.variant_number)
+        if exam is None:
+            sheet.error = f"No exam variant {sheet.variant_number} in config {exam_config_id}"
+            continue
+        by_variant.setdefault(sheet.variant_number, []).append(sheet)
+
+    result = await session.exec(
+        select(ExamQuestion.exam_id, func.count())
+        .where(ExamQuestion.exam_id.in_([exam.id for exam in exams_by_variant.values()]))
+        .group_by(ExamQuestion.exam_id)
+    )
+    question_counts = dict(result.all())
+
+    results = []
+    for variant_number, variant_sheets in sorted(by_variant.items()):
+        exam = exams_by_variant[variant_number]
+        num_questions = question_counts.get(exam.id, 0)
+        graded = []
+        for sheet in variant_sheets:
+            if num_questions and len(sheet.answers) != num_questions:
+                sheet.error = f"Grid has {len(sheet.answers)} questions, variant {variant_number} has {num_questions}"
+            else:
+                graded.append(sheet)
+        if graded:
+            results.append(await grading.grade_exam(
+                session, exam.id, [sheet.sheet for sheet in graded], [sheet.answers for sheet in graded]
+            ))
+
+    return OmrGradingResult(sheets=sheets, results=results)
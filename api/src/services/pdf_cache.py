@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+import threading
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PdfCache:
+    """On-disk cache of compiled PDFs keyed by a hash of their LaTeX inputs.
+
+    Entries are plain files named after the key. Every hit refreshes the
+    file's mtime, and the least recently used entries are deleted once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Bytes on disk, computed lazily
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key_for(workdir: str, main_file: str) -> str:
+        """Hash every .tex file in workdir together with the entry point."""
+        digest = hashlib.sha256(main_file.encode())
+        for name in sorted(os.listdir(workdir)):
+            if not name.endswith(".tex"):
+                continue
+            digest.update(b"\0" + name.encode() + b"\0")
+            with open(os.path.join(workdir, name), "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                pdf = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pdf
+
+    def put(self, key: str, pdf: bytes):
+        path = self._path(key)
+        staging = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(staging, "wb") as f:
+                f.write(pdf)
+            os.replace(staging, path)
+        except OSError as e:
+            logger.warning(f"Could not store PDF in cache: {e}")
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += len(pdf)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pdf"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+pdf_cache = PdfCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
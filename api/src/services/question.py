@@ -7,6 +7,8 @@ from src.utils import parse_moodle_xml
 from src.models.question_option import QuestionOption, QuestionOptionPublic
 from src.models.question import Question, QuestionCreate, QuestionPublic, QuestionUpdate
 from src.models.topic import Topic
+from src.services.latex_text import latex_fragment
+from src.services.question_bank import question_bank
 from typing import Optional, List
 
 logger = logging.getLogger(__name__)
@@ -17,9 +19,12 @@ async def create_question(
 ) -> List[QuestionPublic]:
     """Create a new question"""
     questions = [Question.model_validate(x) for x in question_data]
+    for question in questions:
+        question.latex_text = latex_fragment(question.question_text)
     
     session.add_all(questions)  # More efficient than individual adds
     await session.commit()
+    await question_bank.bump_topics(session, {q.topic_id for q in questions})
     
     for question in questions:
         await session.refresh(question)
@@ -51,7 +56,7 @@ async def create_question_XML(
         
         for q_data in topic_data.get("questions", []):
             # Create question
-            question = Question(topic_id=topic.id, question_text=q_data["text"])
+            question = Question(topic_id=topic.id, question_text=q_data["text"], latex_text=latex_fragment(q_data["text"]))
             session.add(question)
             await session.flush()
             created_questions += 1
@@ -61,12 +66,14 @@ async def create_question_XML(
                 option = QuestionOption(
                     question_id=question.id,
                     option_text=opt["text"],
-                    value=opt["fraction"] > 0
+                    value=opt["fraction"] > 0,
+                    latex_text=latex_fragment(opt["text"])
                 )
                 session.add(option)
                 created_options += 1
     
     await session.commit()
+    question_bank.bump_subject(subject_id)
     
     return {
         "topics_created": created_topics,
@@ -97,10 +104,14 @@ async def update_question(
     if not question:
             raise HTTPException(status_code=404, detail="Question not found")
     
+    old_topic_id = question.topic_id
     question.sqlmodel_update(question_data)
+    question.latex_text = latex_fragment(question.question_text)
+    question.compiles = None  # Checked again in the background
     
     session.add(question)
     await session.commit()
+    await question_bank.bump_topics(session, {old_topic_id, question.topic_id})
     await session.refresh(question)
     return QuestionPublic.model_validate(question)
 
@@ -114,8 +125,10 @@ async def delete_question(session: AsyncSession, question_id: int) -> bool:
     if not question:
         return False
     
+    topic_id = question.topic_id
     await session.delete(question)
     await session.commit()
+    await question_bank.bump_topics(session, [topic_id])
     return True
 
 
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.core.settings import settings
+from src.models.question import Question
+from src.models.question_option import QuestionOption
+from src.models.subject import Subject
+from src.models.topic import Topic
+from src.services.latex_text import latex_fragment
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class BankOption:
+    id: int
+    option_text: str
+    value: bool
+    latex_text: str
+
+
+@dataclass(slots=True)
+class BankQuestion:
+    """Read-only stand-in for a Question with its options, as exam generation uses it."""
+    id: int
+    topic_id: int
+    question_text: str
+    latex_text: str
+    question_options: List[BankOption] = field(default_factory=list)
+
+
+class SubjectBank:
+    """Topics, questions and options of one subject in flat arrays.
+
+    Questions are stored grouped by topic and options grouped by question, so
+    each topic and each question is a [start, end) slice given by an offsets
+    array. Texts and their LaTeX fragments live in plain lists, everything
+    else in typed arrays.
+    """
+
+    def __init__(self, subject_id: int, subject_name: str, version: int):
+        self.subject_id = subject_id
+        self.subject_name = subject_name
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.topic_ids = array("q")
+        self.topic_names: List[str] = []
+        self.topic_offsets = array("l", [0])
+        self.question_ids = array("q")
+        self.question_texts: List[str] = []
+        self.question_latex: List[str] = []
+        self.option_offsets = array("l", [0])
+        self.option_ids = array("q")
+        self.option_texts: List[str] = []
+        self.option_latex: List[str] = []
+        self.option_correct = bytearray()
+        self.question_failing = bytearray()  # 1 where the background check found the question does not compile
+        self._topic_index: Dict[int, int] = {}
+        self._question_index: Dict[int, int] = {}
+
+    def _add_topic(self, topic_id: int, name: str):
+        self._topic_index[topic_id] = len(self.topic_ids)
+        self.topic_ids.append(topic_id)
+        self.topic_names.append(name)
+        self.topic_offsets.append(len(self.question_ids))
+
+    def _add_question(self, question_id: int, text: str, latex: str, failing: bool):
+        self._question_index[question_id] = len(self.question_ids)
+        self.question_ids.append(question_id)
+        self.question_failing.append(1 if failing else 0)
+        self.question_texts.append(text)
+        self.question_latex.append(latex)
+        self.option_offsets.append(len(self.option_ids))
+        self.topic_offsets[-1] = len(self.question_ids)
+
+    def _add_option(self, option_id: int, text: str, correct: bool, latex: str):
+        self.option_ids.append(option_id)
+        self.option_texts.append(text)
+        self.option_latex.append(latex)
+        self.option_correct.append(1 if correct else 0)
+        self.option_offsets[-1] = len(self.option_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the arrays and texts."""
+        arrays = (self.topic_ids, self.topic_offsets, self.question_ids, self.option_offsets, self.option_ids)
+        texts = (self.topic_names, self.question_texts, self.question_latex, self.option_texts, self.option_latex)
+        return (
+            sum(a.itemsize * len(a) for a in arrays)
+            + len(self.option_correct)
+            + len(self.question_failing)
+            + sum(sys.getsizeof(text) for texts_list in texts for text in texts_list)
+            + 200 * (len(self._topic_index) + len(self._question_index))  # Dict entries
+        )
+
+    def has_topic(self, topic_id: int) -> bool:
+        return topic_id in self._topic_index
+
+    def has_question(self, question_id: int) -> bool:
+        return question_id in self._question_index
+
+    def topic_question_ids(self, topic_id: int, include_failing: bool = False) -> List[int]:
+        """Question ids of a topic in ascending order, empty for unknown topics.
+
+        Questions known not to compile are left out unless include_failing.
+        """
+        t = self._topic_index.get(topic_id)
+        if t is None:
+            return []
+        start, end = self.topic_offsets[t], self.topic_offsets[t + 1]
+        if include_failing:
+            return self.question_ids[start:end].tolist()
+        return [self.question_ids[q] for q in range(start, end) if not self.question_failing[q]]
+
+    def failing_question_ids(self, topic_ids: Iterable[int]) -> List[int]:
+        """Ids of the questions of these topics that are known not to compile."""
+        failing = []
+        for topic_id in topic_ids:
+            t = self._topic_index.get(topic_id)
+            if t is not None:
+                failing += [
+                    self.question_ids[q] for q in range(self.topic_offsets[t], self.topic_offsets[t + 1])
+                    if self.question_failing[q]
+                ]
+        return failing
+
+    def question_topic_id(self, index: int) -> int:
+        return self.topic_ids[bisect_right(self.topic_offsets, index) - 1]
+
+    def question(self, question_id: int) -> BankQuestion | None:
+        q = self._question_index.get(question_id)
+        if q is None:
+            return None
+        start, end = self.option_offsets[q], self.option_offsets[q + 1]
+        options = [
+            BankOption(self.option_ids[o], self.option_texts[o], bool(self.option_correct[o]), self.option_latex[o])
+            for o in range(start, end)
+        ]
+        return BankQuestion(question_id, self.question_topic_id(q), self.question_texts[q], self.question_latex[q], options)
+
+    def questions(self, question_ids: Iterable[int]) -> Dict[int, BankQuestion]:
+        found = (self.question(question_id) for question_id in question_ids)
+        return {question.id: question for question in found if question is not None}
+
+    def topic_counts(self) -> List[tuple]:
+        """(topic id, name, number of questions) of every topic."""
+        return [
+            (topic_id, name, self.topic_offsets[t + 1] - self.topic_offsets[t])
+            for t, (topic_id, name) in enumerate(zip(self.topic_ids, self.topic_names))
+        ]
+
+    def as_dict(self) -> dict:
+        """The nested topics -> questions -> options structure of the all-questions endpoint."""
+        subject_topics = {}
+        for t, (topic_id, name) in enumerate(zip(self.topic_ids, self.topic_names)):
+            topic_questions = {}
+            for q in range(self.topic_offsets[t], self.topic_offsets[t + 1]):
+                question_data = {
+                    "question_text": self.question_texts[q],
+                    "question_id": self.question_ids[q],
+                    "question_options": {},
+                    "answer": "",
+                }
+                for o in range(self.option_offsets[q], self.option_offsets[q + 1]):
+                    question_data["question_options"][self.option_ids[o]] = self.option_texts[o]
+                    if self.option_correct[o]:
+                        question_data["answer"] = self.option_ids[o]
+                topic_questions[self.question_ids[q]] = question_data
+            subject_topics[topic_id] = {"topic_name": name, "topic_id": topic_id, "topic_questions": topic_questions}
+        return {"subject_name": self.subject_name, "subject_id": self.subject_id, "subject_topics": subject_topics}
+
+
+class QuestionBankIndex:
+    """Per-subject SubjectBanks kept in memory between requests.
+
+    Every write to a subject's topics, questions or options bumps the
+    subject's version, which drops its bank; the next read loads it again.
+    Bumps are not seen by other API processes, so banks are also reloaded
+    after ttl_seconds. Least recently used subjects are
+    evicted once the banks together exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._banks: OrderedDict[int, SubjectBank] = OrderedDict()
+        self._size = 0
+        self._clock = 0  # Monotonic bank version, shared by all subjects
+        self._versions: Dict[int, int] = {}
+        self._topic_subject: Dict[int, int] = {}
+        self._question_subject: Dict[int, int] = {}
+        self._loading: Dict[int, asyncio.Lock] = {}
+        self._loaders: Dict[int, int] = {}  # Requests holding or waiting for each loading lock
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def version(self, subject_id: int) -> int:
+        return self._versions.get(subject_id, 0)
+
+    async def get(self, session: AsyncSession, subject_id: int) -> SubjectBank | None:
+        """The subject's bank, loaded from the DB if missing or stale; None if the subject does not exist."""
+        bank = self._fresh(subject_id)
+        if bank is not None:
+            self.hits += 1
+            return bank
+
+        lock = self._loading.setdefault(subject_id, asyncio.Lock())
+        self._loaders[subject_id] = self._loaders.get(subject_id, 0) + 1
+        try:
+            async with lock:
+                bank = self._fresh(subject_id)
+                if bank is not None:
+                    self.hits += 1
+                    return bank
+                self.misses += 1
+                # A bump while loading leaves the bank with an old version, so it is not reused
+                bank = await _load_bank(session, subject_id, self.version(subject_id))
+                if bank is not None and self.enabled:
+                    self._store(bank)
+                return bank
+        finally:
+            # The last request for the subject removes its lock, so locks do not pile up per subject ever read
+            self._loaders[subject_id] -= 1
+            if not self._loaders[subject_id]:
+                del self._loaders[subject_id]
+                del self._loading[subject_id]
+
+    def _fresh(self, subject_id: int) -> SubjectBank | None:
+        bank = self._banks.get(subject_id)
+        if bank is None:
+            return None
+        stale = bank.version != self.version(subject_id) or (
+            self.ttl_seconds > 0 and time.monotonic() - bank.loaded_at > self.ttl_seconds
+        )
+        if stale:
+            self._drop(subject_id)
+            return None
+        self._banks.move_to_end(subject_id)
+        return bank
+
+    def _store(self, bank: SubjectBank):
+        self._drop(bank.subject_id)
+        self._banks[bank.subject_id] = bank
+        self._size += bank.nbytes
+        for topic_id in bank.topic_ids:
+            self._topic_subject[topic_id] = bank.subject_id
+        for question_id in bank.question_ids:
+            self._question_subject[question_id] = bank.subject_id
+        # Evict cold subjects, always keeping the one just loaded
+        while self._size > self.max_bytes and len(self._banks) > 1:
+            cold_id = next(iter(self._banks))
+            logger.info(f"Evicting question bank of subject {cold_id}")
+            self._drop(cold_id)
+
+    def _drop(self, subject_id: int):
+        bank = self._banks.pop(subject_id, None)
+        if bank is None:
+            return
+        self._size -= bank.nbytes
+        for topic_id in bank.topic_ids:
+            self._topic_subject.pop(topic_id, None)
+        for question_id in bank.question_ids:
+            self._question_subject.pop(question_id, None)
+
+    def bump_subject(self, subject_id: int):
+        """Record a write to the subject's question bank."""
+        self._clock += 1
+        self._versions[subject_id] = self._clock
+        self._drop(subject_id)
+
+    async def bump_topics(self, session: AsyncSession, topic_ids: Iterable[int]):
+        """Record writes to these topics or their questions."""
+        topic_ids = set(topic_ids)
+        subject_ids = {self._topic_subject[t] for t in topic_ids if t in self._topic_subject}
+        # Topics outside the loaded banks may belong to a subject being loaded right now
+        unknown = [t for t in topic_ids if t not in self._topic_subject]
+        if unknown:
+            result = await session.exec(select(Topic.subject_id).where(Topic.id.in_(unknown)))
+            subject_ids.update(result.all())
+        for subject_id in subject_ids:
+            self.bump_subject(subject_id)
+
+    async def bump_questions(self, session: AsyncSession, question_ids: Iterable[int]):
+        """Record writes to these existing questions or their options."""
+        question_ids = set(question_ids)
+        subject_ids = {self._question_subject[q] for q in question_ids if q in self._question_subject}
+        unknown = [q for q in question_ids if q not in self._question_subject]
+        if unknown:
+            result = await session.exec(
+                select(Topic.subject_id).join(Question, Question.topic_id == Topic.id).where(Question.id.in_(unknown))
+            )
+            subject_ids.update(result.all())
+        for subject_id in subject_ids:
+            self.bump_subject(subject_id)
+
+    def stats(self) -> dict:
+        return {
+            "subjects": len(self._banks),
+            "hits": self.hits,
+            "misses": self.misses,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+async def _load_bank(session: AsyncSession, subject_id: int, version: int) -> SubjectBank | None:
+    """Read a subject's topics, questions and options in one ordered query."""
+    subject = await session.get(Subject, subject_id)
+    if subject is None:
+        return None
+    result = await session.exec(
+        select(Topic.id, Topic.name, Question.id, Question.question_text, Question.latex_text, Question.compiles,
+               QuestionOption.id, QuestionOption.option_text, QuestionOption.value, QuestionOption.latex_text)
+        .select_from(Topic)
+        .outerjoin(Question, Question.topic_id == Topic.id)
+        .outerjoin(QuestionOption, QuestionOption.question_id == Question.id)
+        .where(Topic.subject_id == subject_id)
+        .order_by(Topic.id, Question.id, QuestionOption.id)
+    )
+
+    bank = SubjectBank(subject_id, subject.name, version)
+    last_topic = last_question = None
+    rows = result.all()
+    for topic_id, topic_name, question_id, question_text, question_latex, compiles, option_id, option_text, value, option_latex in rows:
+        if topic_id != last_topic:
+            bank._add_topic(topic_id, topic_name)
+            last_topic = topic_id
+        # Rows written before fragments were stored get them computed here
+        if question_id is not None and question_id != last_question:
+            latex = question_latex if question_latex is not None else latex_fragment(question_text)
+            bank._add_question(question_id, question_text, latex, compiles is False)
+            last_question = question_id
+        if option_id is not None:
+            bank._add_option(option_id, option_text, value, option_latex if option_latex is not None else latex_fragment(option_text))
+    logger.info(f"Loaded question bank of subject {subject_id}: {len(bank.question_ids)} questions, {bank.nbytes} bytes")
+    return bank
+
+
+question_bank = QuestionBankIndex(settings.QUESTION_BANK_MAX_BYTES, settings.QUESTION_BANK_TTL_SECONDS)
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import shutil
+import time
+from typing import Dict, List, Tuple
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from src.core.db import async_session
+from src.core.settings import settings
+from src.models.question import Question
+from src.services.latex_renderer import LatexRenderer
+from src.services.latex_text import latex_fragment
+from src.services.question_bank import question_bank
+from src.services.renderer import RenderOption, RenderQuestion
+
+logger = logging.getLogger(__name__)
+
+# Question id -> monotonic time its inconclusive check may be retried
+_deferred: Dict[int, float] = {}
+
+
+def _render_question(question: Question) -> RenderQuestion:
+    options = [
+        RenderOption(opt.option_text, bool(opt.value), opt.latex_text)
+        for opt in sorted(question.question_options, key=lambda o: o.id)
+    ]
+    return RenderQuestion(question.question_text, 1.0, options, question.latex_text)
+
+
+def _digest(question: RenderQuestion) -> str:
+    """Hash of the LaTeX a question is checked with, to detect edits made during the check."""
+    digest = hashlib.sha256()
+    for item in [question, *question.options]:
+        text = item.latex if item.latex is not None else latex_fragment(item.text)
+        digest.update(text.encode() + b"\0")
+    return digest.hexdigest()
+
+
+async def _load_unchecked(limit: int) -> List[Question]:
+    """Up to limit questions without a compiles flag, with their options, skipping deferred ones."""
+    now = time.monotonic()
+    for question_id in [q for q, retry_at in _deferred.items() if retry_at <= now]:
+        del _deferred[question_id]
+    async with async_session() as session:
+        result = await session.exec(
+            select(Question)
+            .where(Question.compiles.is_(None), Question.id.not_in(list(_deferred)))
+            .options(selectinload(Question.question_options))
+            .order_by(Question.id)
+            .limit(limit)
+        )
+        return list(result.all())
+
+
+async def _find_failing(
+    renderer: LatexRenderer, items: List[Tuple[int, RenderQuestion]], compiles: bool | None = None
+) -> Tuple[List[int], List[int]]:
+    """Ids of the questions that fail to compile on their own, and of those whose check was inconclusive.
+
+    Found by bisecting the batch; compiles is the batch's result when already known.
+    """
+    if compiles is None:
+        compiles = await renderer.check_questions([question for _, question in items])
+    if compiles:
+        return [], []
+    if compiles is None:
+        return [], [question_id for question_id, _ in items]
+    if len(items) == 1:
+        return [items[0][0]], []
+    mid = len(items) // 2
+    (left, left_unknown), (right, right_unknown) = await asyncio.gather(
+        _find_failing(renderer, items[:mid]), _find_failing(renderer, items[mid:])
+    )
+    return left + right, left_unknown + right_unknown
+
+
+async def check_pending() -> int:
+    """Compile the next batch of unchecked questions and store their compiles flag.
+
+    The whole batch goes into one document; only failing halves are compiled
+    again. A question is flagged only when it fails to compile on its own;
+    timeouts, or a failure of the empty control document, leave questions
+    unchecked until QUESTION_CHECK_RETRY_SECONDS pass. Questions edited while
+    the batch compiled stay unchecked. Returns the number of questions in
+    the batch.
+    """
+    questions = await _load_unchecked(settings.QUESTION_CHECK_BATCH)
+    if not questions:
+        return 0
+    items = [(question.id, _render_question(question)) for question in questions]
+    digests = {question_id: _digest(question) for question_id, question in items}
+
+    renderer = LatexRenderer()
+    compiles = await renderer.check_questions([question for _, question in items])
+    if compiles is False and await renderer.check_questions([]) is not True:
+        logger.warning("The LaTeX check fails without any question, pdflatex itself is broken")
+        compiles = None
+    if compiles is None:
+        failing, inconclusive = [], list(digests)
+    else:
+        failing, inconclusive = await _find_failing(renderer, items, compiles)
+    failing = set(failing)
+    retry_at = time.monotonic() + settings.QUESTION_CHECK_RETRY_SECONDS
+    for question_id in inconclusive:
+        _deferred[question_id] = retry_at
+        digests.pop(question_id)
+
+    async with async_session() as session:
+        result = await session.exec(
+            select(Question).where(Question.id.in_(list(digests))).options(selectinload(Question.question_options))
+        )
+        checked = [
+            question for question in result.all()
+            if question.compiles is None and _digest(_render_question(question)) == digests[question.id]
+        ]
+        for question in checked:
+            question.compiles = question.id not in failing
+        session.add_all(checked)
+        await session.commit()
+        await question_bank.bump_questions(session, [question.id for question in checked])
+
+    if failing:
+        logger.warning(f"Questions that do not compile: {sorted(failing)}")
+    if inconclusive:
+        logger.warning(f"Check of {len(inconclusive)} questions was inconclusive, retrying later")
+    logger.info(f"Checked {len(checked)} questions, {len(failing)} do not compile")
+    return len(questions)
+
+
+async def run_checker():
+    """Check new and edited questions in the background until cancelled."""
+    if shutil.which("pdflatex") is None:
+        logger.warning("pdflatex is not installed, questions are not checked")
+        return
+    while True:
+        try:
+            checked = await check_pending()
+        except Exception as e:
+            logger.error(f"Question check failed: {e}")
+            checked = 0
+        if not checked:
+            await asyncio.sleep(settings.QUESTION_CHECK_POLL_SECONDS)
@@ -1,9 +1,17 @@
 from fastapi import HTTPException
+from sqlalchemy import update
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
+from src.models.question import Question
 from src.models.question_option import QuestionOption, QuestionOptionCreate, QuestionOptionPublic, QuestionOptionUpdate
+from src.services.latex_text import latex_fragment
+from src.services.question_bank import question_bank
 from typing import List, Optional
 
+async def _uncheck_questions(session: AsyncSession, question_ids: set):
+    """Clear the compiles flag of questions whose options changed, so they are checked again."""
+    await session.execute(update(Question).where(Question.id.in_(question_ids)).values(compiles=None))
+
 async def create_question_options(
     session: AsyncSession,
     options_data: List[QuestionOptionCreate]
@@ -16,8 +24,12 @@ async def create_question_options(
             raise HTTPException(status_code=400, detail="Duplicate option texts are not allowed")
     
     options = [QuestionOption.model_validate(x) for x in options_data]
+    for option in options:
+        option.latex_text = latex_fragment(option.option_text)
     session.add_all(options)
+    await _uncheck_questions(session, {o.question_id for o in options})
     await session.commit()
+    await question_bank.bump_questions(session, {o.question_id for o in options})
     for option in options:
         await session.refresh(option)
     return [QuestionOptionPublic.model_validate(o) for o in options]
@@ -36,8 +48,11 @@ async def update_question_option(
         raise HTTPException(status_code=404, detail="Question option not found")
     
     option.sqlmodel_update(option_data.model_dump(exclude_unset=True))
+    option.latex_text = latex_fragment(option.option_text)
     session.add(option)
+    await _uncheck_questions(session, {option.question_id})
     await session.commit()
+    await question_bank.bump_questions(session, [option.question_id])
     await session.refresh(option)
     return QuestionOptionPublic.model_validate(option)
 
@@ -51,5 +66,7 @@ async def delete_question_option(session: AsyncSession, option_id: int) -> bool:
         return False
     
     await session.delete(option)
+    await _uncheck_questions(session, {option.question_id})
     await session.commit()
+    await question_bank.bump_questions(session, [option.question_id])
     return True
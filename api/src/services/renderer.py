@@ -0,0 +1,126 @@
+import asyncio
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from src.core.settings import settings
+
+# Characters that only make sense to TeX: commands, math, groups, ties
+TEX_MARKUP = re.compile(r"[\\$^{}~]")
+
+
+@dataclass
+class DocumentHeader:
+    """What the header of every page set of a batch shows."""
+    subject_name: Optional[str] = None
+    semester: str = "1"
+    academic_year: str = "2025/26"
+    exam_title: str = "Exame Época Normal"
+    date_text: Optional[str] = None
+
+
+@dataclass
+class RenderOption:
+    text: str
+    correct: bool = False
+    latex: Optional[str] = None  # Pre-rendered latex_fragment(text), computed on demand if missing
+
+
+@dataclass
+class RenderQuestion:
+    text: str
+    weight: float
+    options: List[RenderOption] = field(default_factory=list)
+    latex: Optional[str] = None
+
+
+@dataclass
+class VariantDocument:
+    """One exam variant: header, rules, answer grid with QR code, and questions."""
+    header: DocumentHeader
+    variant_number: int  # Encoded in the QR code and printed as the version
+    fraction: int
+    questions: List[RenderQuestion]
+    footer: Optional[str] = None
+
+    @property
+    def num_questions(self) -> int:
+        return len(self.questions)
+
+
+@dataclass
+class SolutionsDocument:
+    """Answer grids of every variant in a batch."""
+    header: DocumentHeader
+    answers: Dict[int, Dict[int, str]]  # Variant number -> question number -> letter
+    num_questions: int
+
+
+def _text_needs_tex(text: str | None) -> bool:
+    if not text:
+        return False
+    if TEX_MARKUP.search(text):
+        return True
+    # Beyond Latin-1 the reportlab base fonts have no glyphs; preamble.tex maps
+    # the common symbols (π, ∫, ≤, ...) for pdflatex
+    try:
+        text.encode("latin-1")
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def needs_tex(document: VariantDocument) -> bool:
+    """Whether any text of the document uses TeX markup or characters outside Latin-1."""
+    header = document.header
+    return any(_text_needs_tex(text) for text in (header.subject_name, header.exam_title, header.date_text)) or any(
+        _text_needs_tex(question.text) or any(_text_needs_tex(opt.text) for opt in question.options)
+        for question in document.questions
+    )
+
+
+class PdfRenderer(ABC):
+    """A backend that turns exam documents into PDF bytes."""
+
+    name: str
+
+    @abstractmethod
+    async def render_variant(self, document: VariantDocument) -> bytes | None:
+        """PDF of one variant, or None if rendering failed."""
+
+    @abstractmethod
+    def render_variant_sync(self, document: VariantDocument) -> bytes | None:
+        """Blocking counterpart of render_variant for synchronous callers."""
+
+    @abstractmethod
+    async def render_solutions(self, document: SolutionsDocument) -> bytes | None:
+        """PDF with the answer grids of every variant, or None if rendering failed."""
+
+    async def render_variants(self, documents: List[VariantDocument]) -> Dict[int, bytes] | None:
+        """PDFs of several variants keyed by variant number.
+
+        Backends that can render a batch in one pass override this; the
+        default renders the variants one by one.
+        """
+        pdfs = await asyncio.gather(*(self.render_variant(document) for document in documents))
+        if any(pdf is None for pdf in pdfs):
+            return None
+        return {document.variant_number: pdf for document, pdf in zip(documents, pdfs)}
+
+
+def select_renderer(documents: List[VariantDocument], scratch_dir: str = None) -> PdfRenderer:
+    """Pick the backend for a batch according to PDF_RENDERER.
+
+    In "auto" mode reportlab renders the batch when it is installed and no
+    question needs TeX; otherwise pdflatex does, using scratch_dir for its
+    working directories.
+    """
+    from src.services.latex_renderer import LatexRenderer
+    from src.services.reportlab_renderer import ReportlabRenderer, reportlab_available
+
+    backend = settings.PDF_RENDERER
+    if backend == "reportlab" or (
+        backend == "auto" and reportlab_available() and not any(needs_tex(document) for document in documents)
+    ):
+        return ReportlabRenderer()
+    return LatexRenderer(scratch_dir)
@@ -0,0 +1,198 @@
+import asyncio
+import io
+import logging
+import re
+from typing import Dict, List
+from xml.sax.saxutils import escape
+from src.services.renderer import DocumentHeader, PdfRenderer, SolutionsDocument, VariantDocument
+from src.services.template_registry import template_registry
+
+try:
+    from reportlab.graphics.barcode.qr import QrCodeWidget
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm, inch
+    from reportlab.platypus import KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError:  # The LaTeX renderer is used instead
+    QrCodeWidget = None
+
+logger = logging.getLogger(__name__)
+
+OPTION_LETTERS = "ABCD"
+
+# The little LaTeX Rules.tex uses, so both backends print the same rules
+TEX_TAGS = {"textbf": "b", "textit": "i", "emph": "i"}
+TEX_SYMBOLS = {"times": "×", "div": "÷", "pm": "±"}
+TEX_GROUP = re.compile(r"\\(textbf|textit|emph)\{([^{}]*)\}")
+TEX_MATH = re.compile(r"\$([^$]*)\$")
+TEX_SYMBOL = re.compile(r"\\([A-Za-z]+)\s*")
+RULES_MACRO = "\\renewcommand\\Rules{"
+
+
+def reportlab_available() -> bool:
+    return QrCodeWidget is not None
+
+
+def _tex_markup(tex: str) -> str:
+    """A LaTeX snippet as reportlab paragraph markup: bold, italics, line breaks and a few math symbols."""
+    text = escape(tex)
+    text = TEX_MATH.sub(lambda m: TEX_SYMBOL.sub(lambda s: TEX_SYMBOLS.get(s.group(1), ""), m.group(1)).strip(), text)
+    previous = None
+    while previous != text:  # Innermost groups first
+        previous = text
+        text = TEX_GROUP.sub(lambda m: f"<{TEX_TAGS[m.group(1)]}>{m.group(2)}</{TEX_TAGS[m.group(1)]}>", text)
+    text = " ".join(text.replace("\\\\", "<br/>").split())
+    return re.sub(r"(\s*<br/>)+$", "", text)
+
+
+def _rules_paragraphs(num_questions: int, fraction: int) -> List[str]:
+    """The paragraphs of Rules.tex, rendered as for pdflatex and converted to reportlab markup."""
+    rendered = template_registry.render("Rules.tex", NUM_QUESTIONS=num_questions, FRACTION=fraction / 100.0)
+    body = rendered[rendered.index(RULES_MACRO) + len(RULES_MACRO):rendered.rindex("}")]
+    paragraphs = (_tex_markup(block) for block in re.split(r"\n\s*\n", body))
+    return [paragraph for paragraph in paragraphs if paragraph]
+
+
+def _styles() -> Dict[str, "ParagraphStyle"]:
+    base = getSampleStyleSheet()["Normal"]
+    return {
+        "subject": ParagraphStyle("subject", base, fontSize=20, leading=24, alignment=TA_CENTER),
+        "centered": ParagraphStyle("centered", base, fontSize=10, leading=13, alignment=TA_CENTER),
+        "version": ParagraphStyle("version", base, fontSize=9, leading=12, alignment=TA_CENTER, fontName="Helvetica-Bold"),
+        "body": ParagraphStyle("body", base, fontSize=9, leading=11),
+        "question": ParagraphStyle("question", base, fontSize=10, leading=13, spaceBefore=8),
+        "option": ParagraphStyle("option", base, fontSize=10, leading=13, leftIndent=0.8 * cm, firstLineIndent=-0.5 * cm),
+    }
+
+
+def _header_flowables(header: DocumentHeader, styles: dict, variant_number: int = None) -> list:
+    """Subject, semester, version, title and date, as in H.tex."""
+    semester_text = f"{header.semester}º Semestre, {header.academic_year}"
+    flowables = [
+        Paragraph(escape(header.subject_name or ""), styles["subject"]),
+        Paragraph(escape(semester_text), styles["centered"]),
+    ]
+    if variant_number is not None:
+        flowables.append(Spacer(1, 0.2 * cm))
+        flowables.append(Paragraph(f"Versão {variant_number}", styles["version"]))
+    flowables.append(Spacer(1, 0.3 * cm))
+    flowables.append(Paragraph(escape(header.exam_title), styles["centered"]))
+    if header.date_text:
+        flowables.append(Paragraph(escape(header.date_text), styles["centered"]))
+    return flowables
+
+
+def _grid(num_questions: int, answers: Dict[int, str] = None) -> "Table":
+    """A-D x N answer table like T-answers.tex, with X marks when answers are given."""
+    answers = answers or {}
+    data = [[""] + [f"{q:02d}" for q in range(1, num_questions + 1)]]
+    for letter in OPTION_LETTERS:
+        data.append([letter] + ["X" if answers.get(q) == letter else "" for q in range(1, num_questions + 1)])
+    table = Table(data, colWidths=[0.5 * cm] + [0.55 * cm] * num_questions, rowHeights=0.55 * cm)
+    table.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.75, colors.black),
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]))
+    return table
+
+
+def _qr_code(value: int) -> "Drawing":
+    widget = QrCodeWidget(str(value))
+    x0, y0, x1, y1 = widget.getBounds()
+    size = 0.75 * inch
+    drawing = Drawing(size, size, transform=[size / (x1 - x0), 0, 0, size / (y1 - y0), 0, 0])
+    drawing.add(widget)
+    return drawing
+
+
+def _build(flowables: list, footer: str = None) -> bytes:
+    buffer = io.BytesIO()
+
+    def draw_footer(canvas, doc):
+        if footer:
+            canvas.setFont("Helvetica", 8)
+            canvas.drawCentredString(A4[0] / 2, 1 * cm, f"Page {doc.page}")
+            canvas.drawRightString(A4[0] - 1.5 * cm, 1 * cm, footer)
+
+    doc = SimpleDocTemplate(
+        buffer, pagesize=A4,
+        leftMargin=1.5 * cm, rightMargin=1.5 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm,
+    )
+    doc.build(flowables, onFirstPage=draw_footer, onLaterPages=draw_footer)
+    return buffer.getvalue()
+
+
+def build_variant_pdf(document: VariantDocument) -> bytes:
+    """Lay out one variant: header, identification lines, boxed rules with QR code and grid, questions."""
+    styles = _styles()
+    flowables = _header_flowables(document.header, styles, document.variant_number)
+    flowables.append(Spacer(1, 0.3 * cm))
+    flowables.append(Paragraph("<b>Número mecanográfico</b>: " + "_" * 70, styles["body"]))
+    flowables.append(Spacer(1, 0.2 * cm))
+    flowables.append(Paragraph("<b>Nome</b>: " + "_" * 85, styles["body"]))
+    flowables.append(Spacer(1, 0.3 * cm))
+
+    rules = []
+    for paragraph in _rules_paragraphs(document.num_questions, document.fraction):
+        rules.append(Paragraph(paragraph, styles["body"]))
+        rules.append(Spacer(1, 0.2 * cm))
+    rules += [
+        Spacer(1, 0.1 * cm),
+        # The grid sits right of the QR code, where OMR looks for it
+        Table([[_qr_code(document.variant_number), _grid(document.num_questions)]], style=[("VALIGN", (0, 0), (-1, -1), "MIDDLE")]),
+    ]
+    box = Table([[rules]], colWidths=[A4[0] - 3 * cm])
+    box.setStyle(TableStyle([("BOX", (0, 0), (-1, -1), 0.75, colors.black), ("PADDING", (0, 0), (-1, -1), 6)]))
+    flowables.append(box)
+
+    for q_num, question in enumerate(document.questions, 1):
+        block = [Paragraph(f"<b>{q_num}.</b> ({question.weight:.2f} pts) {escape(question.text)}", styles["question"])]
+        for letter, opt in zip(OPTION_LETTERS, question.options):
+            block.append(Paragraph(f"{letter}. {escape(opt.text)}", styles["option"]))
+        flowables.append(KeepTogether(block))
+
+    return _build(flowables, document.footer)
+
+
+def build_solutions_pdf(document: SolutionsDocument) -> bytes:
+    """Lay out the marked answer grid of every variant."""
+    styles = _styles()
+    flowables = _header_flowables(document.header, styles)
+    flowables.append(Spacer(1, 0.5 * cm))
+    flowables.append(Paragraph("<b>Soluções</b>", ParagraphStyle("solutions", styles["subject"], fontSize=14, leading=18)))
+    flowables.append(Spacer(1, 0.5 * cm))
+    for var_num in sorted(document.answers):
+        row = Table([[Paragraph(f"<b>Version {var_num}</b>", styles["body"]), _grid(document.num_questions, document.answers[var_num])]])
+        flowables.append(KeepTogether([row, Spacer(1, 0.4 * cm)]))
+    return _build(flowables)
+
+
+class ReportlabRenderer(PdfRenderer):
+    """Lays documents out directly with reportlab, without spawning any process.
+
+    Only plain Latin-1 text is supported, so it is used when no text needs TeX.
+    """
+
+    name = "reportlab"
+
+    async def render_variant(self, document: VariantDocument) -> bytes | None:
+        return await asyncio.to_thread(self.render_variant_sync, document)
+
+    def render_variant_sync(self, document: VariantDocument) -> bytes | None:
+        try:
+            return build_variant_pdf(document)
+        except Exception as e:
+            logger.error(f"reportlab rendering of variant {document.variant_number} failed: {e}")
+            return None
+
+    async def render_solutions(self, document: SolutionsDocument) -> bytes | None:
+        try:
+            return await asyncio.to_thread(build_solutions_pdf, document)
+        except Exception as e:
+            logger.error(f"reportlab rendering of the solutions failed: {e}")
+            return None
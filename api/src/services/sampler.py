@@ -0,0 +1,114 @@
+import csv
+import io
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import numpy as np
+from src.core.settings import settings
+from src.models.topic_config import TopicConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VariantSelection:
+    question_ids: List[List[int]]  # Per variant, grouped by topic in config order
+    overlap: np.ndarray  # Variants x variants, number of shared questions
+
+    @property
+    def max_overlap(self) -> int:
+        """Largest number of questions shared by two different variants."""
+        if len(self.overlap) < 2:
+            return 0
+        return int((self.overlap - np.diag(np.diag(self.overlap))).max())
+
+
+def sample_variants(
+    candidates: Dict[int, List[Tuple[int, int]]],
+    topic_configs: List[TopicConfig],
+    num_variations: int,
+    rng: np.random.Generator,
+) -> VariantSelection:
+    """Pick num_questions per topic for every variant at once, keeping variants apart.
+
+    candidates maps topic ids to (question id, recent uses) pairs. Within each
+    topic the variants are filled one question at a time, always taking the
+    question that least increases the sum of squared pairwise overlaps with
+    the variants already built. That spreads questions evenly over the batch
+    before any is repeated. Recent uses add a cost set by
+    QUESTION_REUSE_POLICY, and random jitter breaks ties.
+
+    Raises ValueError if a topic has fewer candidates than requested, so
+    exams are never short and their weights always add up.
+    """
+    question_ids = [[] for _ in range(num_variations)]
+    for t_conf in topic_configs:
+        pool = candidates.get(t_conf.topic_id, [])
+        k = t_conf.num_questions
+        if k > len(pool):
+            raise ValueError(
+                f"Topic {t_conf.topic_id} has only {len(pool)} questions that compile, but {k} were requested."
+            )
+        if not k:
+            continue
+        ids = np.fromiter((question_id for question_id, _ in pool), dtype=np.int64, count=len(pool))
+        uses = np.fromiter((uses for _, uses in pool), dtype=np.int64, count=len(pool))
+        chosen = _balance_topic(_reuse_cost(uses, k, num_variations), k, num_variations, rng)
+        for var_idx, picks in enumerate(ids[chosen]):
+            question_ids[var_idx].extend(picks.tolist())
+
+    return VariantSelection(question_ids, overlap_matrix(question_ids))
+
+
+def _reuse_cost(uses: np.ndarray, k: int, num_variations: int) -> np.ndarray:
+    """Extra selection cost of each candidate for its recent uses."""
+    if not uses.any():
+        return np.zeros(len(uses))
+    if settings.QUESTION_REUSE_POLICY == "exclude":
+        # More than any overlap growth, so used questions only fill what fresh ones cannot
+        return uses * float(num_variations * (2 * k + 1) + 1)
+    decay = min(max(settings.QUESTION_REUSE_DECAY, 1e-6), 1.0)
+    return uses * -np.log(decay)
+
+
+def _balance_topic(cost: np.ndarray, k: int, num_variations: int, rng: np.random.Generator) -> np.ndarray:
+    """Choose k candidate indexes per variant, returned as a variants x k array."""
+    n = len(cost)
+    membership = np.zeros((num_variations, n), dtype=np.int64)
+    chosen = np.empty((num_variations, k), dtype=np.int64)
+    for var_idx in range(num_variations):
+        earlier = membership[:var_idx]
+        shared = np.zeros(var_idx, dtype=np.int64)  # Overlap with each earlier variant so far
+        base = cost + rng.random(n) * 0.5
+        taken = np.zeros(n, dtype=bool)
+        for slot in range(k):
+            # Adding c raises the overlap o with every earlier variant holding c: o^2 -> (o + 1)^2
+            score = (2 * shared + 1) @ earlier + base
+            score[taken] = np.inf
+            pick = int(np.argmin(score))
+            taken[pick] = True
+            chosen[var_idx, slot] = pick
+            shared += earlier[:, pick]
+        membership[var_idx, chosen[var_idx]] = 1
+    return chosen
+
+
+def overlap_matrix(question_ids: List[List[int]]) -> np.ndarray:
+    """Number of questions every pair of variants shares; the diagonal holds each variant's size."""
+    if not question_ids:
+        return np.zeros((0, 0), dtype=np.int64)
+    distinct, inverse = np.unique(np.concatenate([np.asarray(ids, dtype=np.int64) for ids in question_ids]), return_inverse=True)
+    membership = np.zeros((len(question_ids), len(distinct)), dtype=np.int64)
+    rows = np.repeat(np.arange(len(question_ids)), [len(ids) for ids in question_ids])
+    membership[rows, inverse] = 1
+    return membership @ membership.T
+
+
+def overlap_csv(overlap: np.ndarray) -> bytes:
+    """The overlap matrix as CSV with variant numbers as row and column headers."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["variant"] + list(range(1, len(overlap) + 1)))
+    for var_num, row in enumerate(overlap.tolist(), 1):
+        writer.writerow([var_num] + row)
+    return buffer.getvalue().encode()
@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict
+from fastapi import Request
+from src.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting subscriber checks that its own client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+# How long a stream handed to a request counts as listening before it is first read
+STREAM_START_GRACE_SECONDS = 10.0
+# Spooled ZIP bytes kept in memory before the spool moves to a temporary file
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Largest piece read back from the spool for a subscriber that fell behind
+READ_CHUNK_BYTES = 256 * 1024
+
+TRUSTED_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in settings.TRUSTED_PROXIES.split(",") if network.strip()
+]
+
+
+def request_key(exam_specs: dict, caller: str) -> str:
+    """Canonical hash of a generation request: the specs with sorted keys, plus the caller.
+
+    List order is kept, since topic order shapes the generated exams.
+    """
+    canonical = json.dumps(exam_specs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{caller}\0{canonical}".encode()).hexdigest()
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_NETWORKS)
+
+
+def client_address(request: Request) -> str:
+    """The client's address, taken from X-Forwarded-For for connections from TRUSTED_PROXIES.
+
+    Hops are read from the right, as each proxy appends the address it saw,
+    and the first one that is not a trusted proxy is the client.
+    """
+    address = request.client.host if request.client else "unknown"
+    forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    while forwarded and _trusted(address):
+        address = forwarded.pop()
+    return address
+
+
+def caller_of(request: Request) -> str:
+    """Who sent the request: a hash of its bearer token, or the client address without one."""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()
+    return client_address(request)
+
+
+class _Flight:
+    """One running generation whose ZIP is spooled and streamed to every subscriber.
+
+    The ZIP goes to a SpooledTemporaryFile, with only the last chunk kept
+    in memory for subscribers that have caught up. The next chunk is only
+    pulled from the generation once a subscriber has read everything
+    before it: the fastest reader paces the compiles, and slower ones read
+    back from the spool.
+    """
+
+    def __init__(self):
+        self.setup: asyncio.Future | None = None
+        self.producer: asyncio.Task | None = None
+        self.stream: AsyncIterator[bytes] | None = None  # The generation's stream until produce() has closed it
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self.size = 0  # Bytes written to the spool
+        self.tail = b""  # The last chunk written, also in the spool
+        self.done = False
+        self.error: BaseException | None = None
+        self.waiting: Dict[int, Callable[[], Awaitable[bool]] | None] = {}  # Requests waiting for setup
+        self.handed_out: Dict[int, float] = {}  # Streams returned but not read yet, with when
+        self.positions: Dict[int, int] = {}  # Bytes sent by each stream being read
+        self.ids = itertools.count()
+        self._io = asyncio.Lock()
+        self._changed = asyncio.Event()
+
+    async def all_gone(self) -> bool:
+        """Passed to the generation as its is_disconnected: stop once nobody is listening."""
+        if self.positions:
+            return False
+        now = time.monotonic()
+        if any(now - handed_at < STREAM_START_GRACE_SECONDS for handed_at in self.handed_out.values()):
+            return False
+        for is_disconnected in list(self.waiting.values()):
+            if is_disconnected is None or not await is_disconnected():
+                return False
+        return True
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _demanded(self) -> bool:
+        """Wait until a subscriber has read all spooled bytes; False once every client has gone."""
+        while not any(sent >= self.size for sent in self.positions.values()):
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), DISCONNECT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                if await self.all_gone():
+                    return False
+        return True
+
+    def _write_spool(self, chunk: bytes):
+        self.spool.seek(0, os.SEEK_END)
+        self.spool.write(chunk)
+
+    def _read_spool(self, start: int, length: int) -> bytes:
+        self.spool.seek(start)
+        return self.spool.read(length)
+
+    async def _read(self, start: int) -> bytes:
+        tail_start = self.size - len(self.tail)
+        if start >= tail_start:
+            return self.tail[start - tail_start:]
+        async with self._io:
+            return await asyncio.to_thread(self._read_spool, start, min(tail_start - start, READ_CHUNK_BYTES))
+
+    async def produce(self, stream: AsyncIterator[bytes]):
+        try:
+            async with aclosing(stream):
+                self.stream = None
+                chunks = aiter(stream)
+                while True:
+                    if not await self._demanded():
+                        logger.info("Every client of the generation has gone, stopping it")
+                        self.error = RuntimeError("every client disconnected")
+                        break
+                    try:
+                        chunk = await anext(chunks)
+                    except StopAsyncIteration:
+                        break
+                    if chunk:
+                        async with self._io:
+                            await asyncio.to_thread(self._write_spool, chunk)
+                        self.size += len(chunk)
+                        self.tail = chunk
+                        self._notify()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.done = True
+            self._notify()
+            self.close_if_unused()
+
+    async def subscribe(self, stream_id: int, is_disconnected=None) -> AsyncIterator[bytes]:
+        """Yield the ZIP from its first byte on, waiting for new chunks until the stream ends."""
+        # From its first read the stream is a subscriber; unread, it only counts during the grace period
+        self.handed_out.pop(stream_id, None)
+        if self.spool.closed:
+            raise RuntimeError("Exam generation result is no longer available")
+        self.positions[stream_id] = 0
+        self._notify()
+        try:
+            while True:
+                sent = self.positions[stream_id]
+                if sent < self.size:
+                    chunk = await self._read(sent)
+                    self.positions[stream_id] = sent + len(chunk)
+                    self._notify()
+                    yield chunk
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise RuntimeError(f"Exam generation failed: {self.error}") from self.error
+                    return
+                changed = self._changed
+                if is_disconnected is None:
+                    await changed.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), DISCONNECT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+        finally:
+            del self.positions[stream_id]
+            self._notify()
+            self.close_if_unused()
+
+    def expire_handed_out(self):
+        """Stop waiting for streams that were handed out but never read."""
+        self.handed_out.clear()
+        self.close_if_unused()
+
+    def close_if_unused(self):
+        if self.done and not self.positions and not self.waiting and not self.handed_out:
+            self.spool.close()
+
+
+class SingleFlight:
+    """Runs identical generation requests once and streams the result to all of them.
+
+    A request whose key matches a generation that is still running attaches
+    to it and receives the same ZIP from the first byte. Only running
+    generations are shared: once the ZIP is complete the key is forgotten, so
+    later requests generate afresh. The generation only stops early once
+    every attached client has gone.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._closing = set()
+
+    async def stream(
+        self,
+        key: str,
+        start: Callable[[Callable[[], Awaitable[bool]]], Awaitable[AsyncIterator[bytes]]],
+        is_disconnected=None,
+    ) -> AsyncIterator[bytes]:
+        """Join the generation for key, or begin it with start(is_disconnected).
+
+        Errors raised by start before streaming (such as validation errors)
+        are raised to every request that joined.
+        """
+        flight = self._flights.get(key)
+        # A finished flight is only still here until its done callback runs, and may have closed its spool
+        if flight is None or flight.done:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.setup = asyncio.ensure_future(start(flight.all_gone))
+            flight.setup.add_done_callback(lambda setup: self._started(key, flight, setup))
+        else:
+            logger.info(f"Attaching to the running generation {key[:12]}")
+
+        waiter_id = next(flight.ids)
+        flight.waiting[waiter_id] = is_disconnected
+        try:
+            # Shielded so a request cancelled here does not cancel the others' setup
+            await asyncio.shield(flight.setup)
+        finally:
+            del flight.waiting[waiter_id]
+        stream_id = next(flight.ids)
+        flight.handed_out[stream_id] = time.monotonic()
+        return flight.subscribe(stream_id, is_disconnected)
+
+    def _started(self, key: str, flight: _Flight, setup: asyncio.Future):
+        if setup.cancelled() or setup.exception() is not None:
+            self._forget(key, flight)
+            flight.spool.close()  # Every joined request gets the error, nothing is streamed
+            return
+        flight.stream = setup.result()
+        flight.producer = asyncio.create_task(flight.produce(flight.stream))
+        flight.producer.add_done_callback(lambda _: self._finished(key, flight))
+
+    def _finished(self, key: str, flight: _Flight):
+        self._forget(key, flight)
+        if flight.stream is not None:
+            # The producer was cancelled before it ran, so close the stream (and free its admission slot) here
+            closing = asyncio.ensure_future(flight.stream.aclose())
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+            flight.stream = None
+        if flight.handed_out:
+            asyncio.get_running_loop().call_later(STREAM_START_GRACE_SECONDS, flight.expire_handed_out)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+generation_flights = SingleFlight()
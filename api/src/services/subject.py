@@ -2,80 +2,32 @@ import logging
 from typing import List, Optional, Tuple
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.orm import joinedload
 
-from src.models.question_option import QuestionOption
-from src.models.question import Question
 from src.models.topic import Topic, TopicPublic
 from src.models.subject import Subject
+from src.services.question_bank import question_bank
 
 logger = logging.getLogger(__name__)
 
 async def get_topics_questions_and_options_by_subject_id(
     session: AsyncSession, subject_id: int
 ) -> dict:
-    #não tocar nesta query, está bem cozinhada
-    stmt = (
-        select(Subject)
-        .where(Subject.id == subject_id)
-        .options(
-            joinedload(Subject.topics)
-                .joinedload(Topic.questions)
-                .joinedload(Question.question_options)
-        )
-    )
-
-    result = await session.exec(stmt)
-    subject: Subject | None = result.unique().one_or_none()
-
-    if not subject:
+    """Topics, questions and options of a subject, served from the in-memory question bank."""
+    #não tocar nesta query, está bem cozinhada: vive agora em question_bank._load_bank
+    bank = await question_bank.get(session, subject_id)
+    if bank is None:
         return {}
-
-    result_subject = {
-        "subject_name": subject.name,
-        "subject_id":subject.id,
-        "subject_topics": {}
-    }
-
-    for topic in subject.topics:
-        topic_data = {
-            "topic_name": topic.name,
-            "topic_id":topic.id,
-            "topic_questions": {}
-        }
-
-        for question in topic.questions:
-            question_data = {
-                "question_text": question.question_text,
-                "question_id":question.id,
-                "question_options": {},
-                "answer" : ""
-            }
-
-            for option in question.question_options:
-                question_data["question_options"][option.id] = option.option_text
-
-                if option.value:
-                    question_data["answer"] = option.id
-
-            topic_data["topic_questions"][question.id] = question_data
-
-        result_subject["subject_topics"][topic.id] = topic_data
-
-    return result_subject
+    return bank.as_dict()
 
 async def get_all_subject_topics(session: AsyncSession, subject_id: int) -> List[Tuple[TopicPublic, int]]:
-    topics_result = await session.exec(select(Topic).where(Topic.subject_id == subject_id))
-    topics = topics_result.all()
-    
-    result = []
-    for topic in topics:
-        questions_result = await session.exec(select(Question).where(Question.topic_id == topic.id))
-        count = len(questions_result.all())
-        result.append((TopicPublic.model_validate(topic), count))
-    
-    return result
-    
+    """Topics of a subject with their number of questions."""
+    bank = await question_bank.get(session, subject_id)
+    if bank is None:
+        return []
+    return [
+        (TopicPublic(id=topic_id, name=name, subject_id=subject_id), count)
+        for topic_id, name, count in bank.topic_counts()
+    ]
 
 
 async def create_subject(session: AsyncSession, name: str) -> Subject:
@@ -104,6 +56,7 @@ async def update_subject(session: AsyncSession, subject_id: int, name: Optional[
         subject.name = name
     session.add(subject)
     await session.commit()
+    question_bank.bump_subject(subject_id)
     await session.refresh(subject)
     return subject
 
@@ -127,6 +80,7 @@ async def delete_subject(session: AsyncSession, subject_id: int) -> bool:
     
     await session.delete(subject)
     await session.commit()
+    question_bank.bump_subject(subject_id)
     return True
 
 async def get_topics_from_subject(session: AsyncSession, subject_id: int) -> List[Topic]:
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import Dict
+from src.services.latex import TEMPLATES_DIR
+
+logger = logging.getLogger(__name__)
+
+# Placeholders are upper-case words after a '#', e.g. #NUM_QUESTIONS.
+# LaTeX macro parameters (#1..#9) and mixed-case words never match.
+PLACEHOLDER = re.compile(r"#([A-Z][A-Z0-9_]*)(?![A-Za-z0-9])")
+
+
+class LatexTemplate:
+    """A LaTeX template split once into literal text and #PLACEHOLDER names."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        parts = PLACEHOLDER.split(text)
+        self._literals = parts[0::2]
+        self._names = parts[1::2]
+        self.placeholders = frozenset(self._names)
+
+    @property
+    def is_static(self) -> bool:
+        return not self._names
+
+    def render(self, **values) -> str:
+        """Fill every placeholder; values are inserted verbatim."""
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise KeyError(f"Template {self.name} is missing values for {', '.join(sorted(missing))}")
+        out = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            out.append(str(values[name]))
+            out.append(literal)
+        return "".join(out)
+
+
+class TemplateRegistry:
+    """The .tex templates, read from disk once and rendered in memory.
+
+    A compile directory gets every placeholder-free template plus the files
+    rendered for that document, each written exactly once.
+    """
+
+    def __init__(self, templates_dir: str):
+        self.templates_dir = templates_dir
+        self._templates: Dict[str, LatexTemplate] | None = None
+        self._version: str | None = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        templates = {}
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(self.templates_dir)):
+            if name.endswith(".tex"):
+                with open(os.path.join(self.templates_dir, name), "r") as f:
+                    templates[name] = LatexTemplate(name, f.read())
+                digest.update(name.encode() + b"\0" + templates[name].text.encode() + b"\0")
+        with self._lock:
+            self._templates = templates
+            self._version = digest.hexdigest()[:12]
+        logger.info(f"Loaded {len(templates)} LaTeX templates from {self.templates_dir} (version {self._version})")
+
+    @property
+    def templates(self) -> Dict[str, LatexTemplate]:
+        if self._templates is None:
+            self.load()
+        return self._templates
+
+    @property
+    def version(self) -> str:
+        """Short hash of every template, recorded with generated exams."""
+        if self._templates is None:
+            self.load()
+        return self._version
+
+    def get(self, name: str) -> LatexTemplate:
+        return self.templates[name]
+
+    def render(self, name: str, **values) -> str:
+        return self.get(name).render(**values)
+
+    def write_workdir(self, workdir: str, files: Dict[str, str]):
+        """Write the static templates and the given rendered files into workdir.
+
+        files maps file names to their full content and takes precedence
+        over a template of the same name.
+        """
+        contents = {name: t.text for name, t in self.templates.items() if t.is_static}
+        contents.update(files)
+        for name, content in contents.items():
+            with open(os.path.join(workdir, name), "w") as f:
+                f.write(content)
+
+
+template_registry = TemplateRegistry(TEMPLATES_DIR)
@@ -2,6 +2,7 @@ from fastapi import HTTPException
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.models.topic import Topic, TopicCreate, TopicPublic, TopicUpdate
+from src.services.question_bank import question_bank
 from typing import Optional, List
 
 
@@ -13,6 +14,7 @@ async def create_topic(
     topic = Topic.model_validate(topic_data)
     session.add(topic)
     await session.commit()
+    question_bank.bump_subject(topic.subject_id)
     await session.refresh(topic)
     return TopicPublic.model_validate(topic)
 
@@ -46,11 +48,14 @@ async def update_topic(
     if not topic:
             raise HTTPException(status_code=404, detail="Topic not found")
     
+    old_subject_id = topic.subject_id
     data = topic_data.model_dump()
     topic.sqlmodel_update(data)
 
     session.add(topic)
     await session.commit()
+    question_bank.bump_subject(old_subject_id)
+    question_bank.bump_subject(topic.subject_id)
     await session.refresh(topic)
     return TopicPublic.model_validate(topic)
 
@@ -66,4 +71,5 @@ async def delete_topic(session: AsyncSession, topic_id: int) -> bool:
     
     await session.delete(topic)
     await session.commit()
+    question_bank.bump_subject(topic.subject_id)
     return True
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+import pytest
+from src.services import admission
+from src.services.admission import AdmissionController, AdmittedStream, QueueFull
+
+
+async def _queue(controller, keys, admitted):
+    async def wait(key, n):
+        await controller.acquire(key)
+        admitted.append(f"{key}{n}")
+
+    tasks = [asyncio.create_task(wait(key, n)) for n, key in enumerate(keys, 1)]
+    await asyncio.sleep(0)
+    return tasks
+
+
+def test_free_slots_are_granted_without_waiting():
+    async def main():
+        controller = AdmissionController(2, 5)
+        assert await controller.acquire("a") == 0.0
+        assert await controller.acquire("b") == 0.0
+        assert controller.active == 2 and controller.queued == 0
+
+    asyncio.run(main())
+
+
+def test_slots_go_round_robin_across_keys():
+    async def main():
+        controller = AdmissionController(1, 10)
+        await controller.acquire("x")
+        admitted = []
+        tasks = await _queue(controller, ["a", "a", "a", "b", "c"], admitted)
+        for _ in tasks:
+            controller.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return admitted
+
+    assert asyncio.run(main()) == ["a1", "b4", "c5", "a2", "a3"]
+
+
+def test_full_queue_rejects_bounded_requests_with_retry_after():
+    async def main():
+        controller = AdmissionController(1, 2)
+        await controller.acquire("x")
+        tasks = await _queue(controller, ["a", "b"], [])
+        with pytest.raises(QueueFull) as rejected:
+            await controller.acquire("c")
+        assert rejected.value.retry_after >= 1
+        assert controller.rejected == 1
+
+        # Background jobs are already queued elsewhere and always wait
+        unbounded = asyncio.create_task(controller.acquire("jobs", bounded=False))
+        await asyncio.sleep(0)
+        assert controller.queued == 3
+        for task in [*tasks, unbounded]:
+            task.cancel()
+        await asyncio.gather(*tasks, unbounded, return_exceptions=True)
+        assert controller.queued == 0
+
+    asyncio.run(main())
+
+
+def test_retry_after_grows_with_the_queue():
+    controller = AdmissionController(2, 10)
+    controller.queued = 1
+    short = controller.retry_after()
+    controller.queued = 7
+    assert controller.retry_after() > short
+
+
+def test_slot_handed_to_a_cancelled_waiter_passes_on():
+    async def main():
+        controller = AdmissionController(1, 5)
+        await controller.acquire("x")
+        first = asyncio.create_task(controller.acquire("a"))
+        second = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+
+        controller.release()  # Hands the slot to first, which is cancelled before it resumes
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, 1)
+        assert controller.active == 1 and controller.queued == 0
+
+    asyncio.run(main())
+
+
+def test_disconnected_client_leaves_the_queue(monkeypatch):
+    monkeypatch.setattr(admission, "DISCONNECT_POLL_SECONDS", 0.01)
+
+    async def main():
+        controller = AdmissionController(1, 5)
+        await controller.acquire("x")
+        gone = False
+
+        async def is_disconnected():
+            return gone
+
+        leaving = asyncio.create_task(controller.acquire("a", is_disconnected=is_disconnected))
+        staying = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0.05)
+        assert controller.queued == 2
+
+        gone = True
+        assert await asyncio.wait_for(leaving, 1) is None
+        assert controller.queued == 1 and controller.abandoned == 1
+
+        controller.release()
+        await asyncio.wait_for(staying, 1)
+        assert controller.active == 1 and controller.queued == 0
+
+    asyncio.run(main())
+
+
+async def _chunks():
+    yield b"a"
+    yield b"b"
+
+
+def test_admitted_stream_releases_when_closed_before_reading():
+    async def main():
+        controller = AdmissionController(1, 5)
+        await controller.acquire("x")
+        stream = AdmittedStream(controller, _chunks())
+        await stream.aclose()
+        await stream.aclose()
+        assert controller.active == 0
+
+    asyncio.run(main())
+
+
+def test_admitted_stream_releases_once_when_exhausted():
+    async def main():
+        controller = AdmissionController(2, 5)
+        await controller.acquire("x")
+        await controller.acquire("y")
+        stream = AdmittedStream(controller, _chunks())
+        assert [chunk async for chunk in stream] == [b"a", b"b"]
+        await stream.aclose()
+        assert controller.active == 1
+
+    asyncio.run(main())
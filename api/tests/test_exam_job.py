@@ -0,0 +1,126 @@
+"""Job queue tests. They need an empty PostgreSQL database of their own, given
+as TEST_PGSQL_DATABASE_URI (its exam_job table is cleared), and are skipped
+without one."""
+import asyncio
+import os
+from datetime import timedelta
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+import src.models  # noqa: F401 - registers every table
+from src.core.settings import settings
+from src.models.exam_job import ExamJob, ExamJobStatus, utcnow
+from src.services import exam_job
+
+DATABASE_URI = os.environ.get("TEST_PGSQL_DATABASE_URI")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URI, reason="TEST_PGSQL_DATABASE_URI is not set")
+
+
+@pytest.fixture
+def run(monkeypatch, tmp_path):
+    """Run a test coroutine against the test database, with exam_job using it."""
+    monkeypatch.setattr(settings, "EXAM_JOBS_DIR", str(tmp_path))
+
+    def run(test):
+        async def main():
+            engine = create_async_engine(DATABASE_URI.replace("postgresql://", "postgresql+asyncpg://"))
+            session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            monkeypatch.setattr(exam_job, "async_session", session_factory)
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(SQLModel.metadata.create_all)
+                    await conn.execute(delete(ExamJob))
+                return await test(session_factory)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+async def _add_job(sessions, status=ExamJobStatus.PENDING, age_seconds=0, **values) -> str:
+    at = utcnow() - timedelta(seconds=age_seconds)
+    job = ExamJob(exam_specs={}, status=status, created_at=at, updated_at=at, **values)
+    async with sessions() as session:
+        session.add(job)
+        await session.commit()
+    return job.id
+
+
+async def _status(sessions, job_id) -> ExamJob:
+    async with sessions() as session:
+        return await session.get(ExamJob, job_id)
+
+
+def test_claims_pending_jobs_oldest_first(run):
+    async def test(sessions):
+        newer = await _add_job(sessions, age_seconds=1)
+        older = await _add_job(sessions, age_seconds=2)
+        claimed = [(await exam_job._claim_next_job()).id, (await exam_job._claim_next_job()).id]
+        assert claimed == [older, newer]
+        assert await exam_job._claim_next_job() is None
+        assert (await _status(sessions, older)).status == ExamJobStatus.RUNNING
+    run(test)
+
+
+def test_running_job_without_heartbeat_is_claimed_again(run):
+    async def test(sessions):
+        stale_seconds = settings.EXAM_JOB_STALE_SECONDS
+        await _add_job(sessions, ExamJobStatus.RUNNING, age_seconds=stale_seconds // 2)
+        await _add_job(sessions, ExamJobStatus.DONE, age_seconds=stale_seconds * 2)
+        await _add_job(sessions, ExamJobStatus.FAILED, age_seconds=stale_seconds * 2)
+        abandoned = await _add_job(sessions, ExamJobStatus.RUNNING, age_seconds=stale_seconds * 2)
+
+        claimed = await exam_job._claim_next_job()
+        assert claimed.id == abandoned
+        assert utcnow() - claimed.updated_at < timedelta(seconds=stale_seconds)
+        assert await exam_job._claim_next_job() is None
+    run(test)
+
+
+def test_concurrent_workers_never_claim_the_same_job(run):
+    async def test(sessions):
+        for _ in range(3):
+            await _add_job(sessions)
+        claimed = await asyncio.gather(*(exam_job._claim_next_job() for _ in range(5)))
+        ids = [job.id for job in claimed if job]
+        assert len(ids) == 3 and len(set(ids)) == 3
+    run(test)
+
+
+def test_interrupted_job_goes_back_to_the_queue(run, monkeypatch):
+    async def test(sessions):
+        running = asyncio.Event()
+
+        async def create_configs(session, exam_specs):
+            running.set()
+            await asyncio.sleep(60)
+
+        monkeypatch.setattr(exam_job.exam_service, "create_configs", create_configs)
+        job_id = await _add_job(sessions)
+        worker = asyncio.create_task(exam_job._run_job(await exam_job._claim_next_job()))
+        await running.wait()
+        worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await worker
+        assert (await _status(sessions, job_id)).status == ExamJobStatus.PENDING
+        assert (await exam_job._claim_next_job()).id == job_id
+    run(test)
+
+
+def test_failed_job_records_the_error(run, monkeypatch, tmp_path):
+    async def test(sessions):
+        async def create_configs(session, exam_specs):
+            raise ValueError("Topic 7 does not exist")
+
+        monkeypatch.setattr(exam_job.exam_service, "create_configs", create_configs)
+        job_id = await _add_job(sessions)
+        await exam_job._run_job(await exam_job._claim_next_job())
+        job = await _status(sessions, job_id)
+        assert job.status == ExamJobStatus.FAILED
+        assert job.error == "Topic 7 does not exist"
+        assert os.listdir(tmp_path) == []
+    run(test)
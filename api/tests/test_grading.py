@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from src.services.grading import UNANSWERED, encode_answers, score_responses
+
+ANSWER_KEY = np.array([0, 1, 2, 3])
+WEIGHTS = np.array([5.0, 5.0, 5.0, 5.0])
+
+
+def test_all_correct_scores_the_full_weight():
+    result = score_responses(ANSWER_KEY, WEIGHTS, np.array([[0, 1, 2, 3]]), 25)
+
+    assert result["scores"].tolist() == [20.0]
+    assert result["correct"].tolist() == [4]
+    assert result["wrong"].tolist() == [0]
+
+
+def test_wrong_answers_deduct_the_fraction_of_their_weight():
+    result = score_responses(ANSWER_KEY, WEIGHTS, np.array([[0, 1, 0, 0]]), 25)
+
+    assert result["scores"].tolist() == [pytest.approx(10.0 - 2 * 1.25)]
+    assert result["wrong"].tolist() == [2]
+
+
+def test_unanswered_questions_score_zero():
+    responses = np.array([[0, UNANSWERED, UNANSWERED, UNANSWERED]])
+    result = score_responses(ANSWER_KEY, WEIGHTS, responses, 25)
+
+    assert result["scores"].tolist() == [5.0]
+    assert result["unanswered"].tolist() == [3]
+    assert result["wrong"].tolist() == [0]
+
+
+def test_students_are_scored_independently_with_per_question_rates():
+    responses = np.array([
+        [0, 1, 2, 3],
+        [1, 1, UNANSWERED, 3],
+    ])
+    result = score_responses(ANSWER_KEY, np.array([2.0, 4.0, 6.0, 8.0]), responses, 50)
+
+    assert result["scores"].tolist() == [20.0, pytest.approx(12.0 - 1.0)]
+    assert result["question_correct_rate"].tolist() == [0.5, 1.0, 0.5, 1.0]
+
+
+def test_no_students_gives_empty_results():
+    result = score_responses(ANSWER_KEY, WEIGHTS, np.empty((0, 4), dtype=np.int64), 25)
+
+    assert result["scores"].tolist() == []
+    assert result["question_correct_rate"].tolist() == [0.0, 0.0, 0.0, 0.0]
+
+
+def test_question_without_a_key_is_voided():
+    answer_key = np.array([0, UNANSWERED, 2, 3])
+    responses = np.array([
+        [0, 1, 2, 3],
+        [0, UNANSWERED, 2, 3],
+    ])
+    result = score_responses(answer_key, WEIGHTS, responses, 25)
+
+    # No credit and no penalty for anyone on question 2, answered or not
+    assert result["scores"].tolist() == [15.0, 15.0]
+    assert result["correct"].tolist() == [3, 3]
+    assert result["wrong"].tolist() == [0, 0]
+    assert result["unanswered"].tolist() == [0, 1]
+    assert result["voided"].tolist() == [False, True, False, False]
+    assert result["question_correct_rate"].tolist() == [1.0, 0.0, 1.0, 1.0]
+
+
+def test_blank_key_letters_encode_as_voided():
+    key = encode_answers([["A", "", "c", "D"]], 4)[0]
+
+    assert key.tolist() == [0, UNANSWERED, 2, 3]
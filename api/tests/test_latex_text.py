@@ -0,0 +1,28 @@
+from src.services.latex_text import latex_fragment
+
+
+def test_specials_are_escaped_in_running_text():
+    assert latex_fragment("50% of A & B_1 #1") == "50\\% of A \\& B\\_1 \\#1"
+
+
+def test_math_is_kept_except_comment_and_parameter_characters():
+    assert latex_fragment("Solve $x_1 + y_2 = 50%$") == "Solve $x_1 + y_2 = 50\\%$"
+    assert latex_fragment("\\[a_{ij} & b\\]") == "\\[a_{ij} & b\\]"
+    assert latex_fragment("$$\\sum_i x_i$$") == "$$\\sum_i x_i$$"
+
+
+def test_already_escaped_characters_are_not_escaped_again():
+    assert latex_fragment("100\\% and \\$5 and a\\_b") == "100\\% and \\$5 and a\\_b"
+
+
+def test_commands_are_kept_but_their_arguments_are_escaped():
+    assert latex_fragment("\\textbf{a_b} \\emph{x}") == "\\textbf{a\\_b} \\emph{x}"
+
+
+def test_whitespace_is_normalized():
+    assert latex_fragment("  a \t b\r\n\r\n\n  c  ") == "a b\n\nc"
+
+
+def test_empty_text():
+    assert latex_fragment("") == ""
+    assert latex_fragment(None) == ""
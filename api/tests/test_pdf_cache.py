@@ -0,0 +1,79 @@
+import asyncio
+import os
+from src.services import latex
+from src.services.pdf_cache import PdfCache
+
+
+def _workdir(tmp_path, **files):
+    workdir = tmp_path / "work"
+    workdir.mkdir(exist_ok=True)
+    for name, content in files.items():
+        (workdir / name.replace("_tex", ".tex").replace("_log", ".log")).write_text(content)
+    return str(workdir)
+
+
+def test_key_follows_tex_inputs_and_entry_point(tmp_path):
+    workdir = _workdir(tmp_path, main_tex="main", body_tex="body", run_log="ignored")
+    key = PdfCache.key_for(workdir, "main.tex")
+
+    assert PdfCache.key_for(workdir, "main.tex") == key
+    assert PdfCache.key_for(workdir, "other.tex") != key
+    _workdir(tmp_path, run_log="changed")
+    assert PdfCache.key_for(workdir, "main.tex") == key
+    _workdir(tmp_path, body_tex="edited")
+    assert PdfCache.key_for(workdir, "main.tex") != key
+
+
+def test_get_returns_stored_pdfs_and_counts_hits(tmp_path):
+    cache = PdfCache(str(tmp_path / "cache"), 1000)
+
+    assert cache.get("a") is None
+    cache.put("a", b"%PDF-a")
+    assert cache.get("a") == b"%PDF-a"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = PdfCache(str(cache_dir), 350)
+    for n, key in enumerate("abc", 1):
+        cache.put(key, bytes(100))
+        os.utime(cache_dir / f"{key}.pdf", (n * 1000, n * 1000))
+
+    cache.get("a")  # Now the most recently used
+    cache.put("d", bytes(100))
+
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["a.pdf", "c.pdf", "d.pdf"]
+    assert cache.stats()["size_bytes"] == 300
+
+
+def test_zero_max_bytes_disables_the_cache(tmp_path):
+    assert not PdfCache(str(tmp_path), 0).enabled
+
+
+def test_cached_pdf_is_served_without_pdflatex(tmp_path, monkeypatch):
+    cache = PdfCache(str(tmp_path / "cache"), 1000)
+    workdir = _workdir(tmp_path, main_tex="main")
+    cache.put(cache.key_for(workdir, "main.tex"), b"%PDF-cached")
+    monkeypatch.setattr(latex, "pdf_cache", cache)
+
+    async def no_pdflatex(*args):
+        raise AssertionError("pdflatex was run")
+
+    monkeypatch.setattr(latex, "_run_once", no_pdflatex)
+    assert asyncio.run(latex.run_pdflatex(workdir, "main.tex")) == b"%PDF-cached"
+
+
+def test_compiled_pdf_is_stored(tmp_path, monkeypatch):
+    cache = PdfCache(str(tmp_path / "cache"), 1000)
+    workdir = _workdir(tmp_path, main_tex="main")
+    monkeypatch.setattr(latex, "pdf_cache", cache)
+    monkeypatch.setattr(latex, "_format_checked", True)
+    monkeypatch.setattr(latex, "_format_path", None)
+
+    async def compiled(*args):
+        return b"%PDF-new"
+
+    monkeypatch.setattr(latex, "_run_once", compiled)
+    assert asyncio.run(latex.run_pdflatex(workdir, "main.tex")) == b"%PDF-new"
+    assert cache.get(cache.key_for(workdir, "main.tex")) == b"%PDF-new"
@@ -0,0 +1,92 @@
+import asyncio
+from src.services import question_bank as question_bank_module
+from src.services.question_bank import QuestionBankIndex, SubjectBank
+
+
+def _bank(subject_id, version=0, questions=2):
+    bank = SubjectBank(subject_id, f"Subject {subject_id}", version)
+    bank._add_topic(subject_id * 100, "Topic")
+    for n in range(questions):
+        question_id = subject_id * 100 + n
+        bank._add_question(question_id, f"Question {n}", f"Question {n}", failing=n == 1)
+        bank._add_option(question_id * 10, "Yes", True, "Yes")
+        bank._add_option(question_id * 10 + 1, "No", False, "No")
+    return bank
+
+
+def test_bank_slices_questions_and_options():
+    bank = _bank(1)
+
+    assert bank.topic_question_ids(100) == [100]
+    assert bank.topic_question_ids(100, include_failing=True) == [100, 101]
+    assert bank.failing_question_ids([100]) == [101]
+    question = bank.question(101)
+    assert question.topic_id == 100
+    assert [(o.id, o.value) for o in question.question_options] == [(1010, True), (1011, False)]
+
+
+def test_bump_drops_the_subject_bank():
+    index = QuestionBankIndex(max_bytes=10**6, ttl_seconds=0)
+    index._store(_bank(1))
+    index._store(_bank(2))
+
+    index.bump_subject(1)
+
+    assert index._fresh(1) is None
+    assert index._fresh(2) is not None
+    assert 100 not in index._topic_subject and 200 in index._topic_subject
+
+
+def test_bank_loaded_before_a_bump_is_stale():
+    index = QuestionBankIndex(max_bytes=10**6, ttl_seconds=0)
+    index.bump_subject(1)
+    index._store(_bank(1, version=0))
+
+    assert index._fresh(1) is None
+    assert index.stats()["size_bytes"] == 0
+
+
+def test_least_recently_used_subject_is_evicted():
+    one_bank = _bank(1).nbytes
+    index = QuestionBankIndex(max_bytes=one_bank * 2 + one_bank // 2, ttl_seconds=0)
+    index._store(_bank(1))
+    index._store(_bank(2))
+    index._fresh(1)  # Now the most recently used
+
+    index._store(_bank(3))
+
+    assert list(index._banks) == [1, 3]
+
+
+def test_get_loads_once_and_forgets_the_lock(monkeypatch):
+    index = QuestionBankIndex(max_bytes=10**6, ttl_seconds=0)
+    loads = []
+
+    async def load(session, subject_id, version):
+        loads.append(subject_id)
+        await asyncio.sleep(0.01)
+        return _bank(subject_id, version)
+
+    monkeypatch.setattr(question_bank_module, "_load_bank", load)
+
+    async def main():
+        return await asyncio.gather(*(index.get(None, 1) for _ in range(3)))
+
+    banks = asyncio.run(main())
+    assert loads == [1]
+    assert banks[0] is banks[1] is banks[2]
+    assert index._loading == {} and index._loaders == {}
+
+
+def test_bump_during_load_is_not_lost(monkeypatch):
+    index = QuestionBankIndex(max_bytes=10**6, ttl_seconds=0)
+
+    async def load(session, subject_id, version):
+        index.bump_subject(subject_id)  # A write lands while the rows are read
+        return _bank(subject_id, version)
+
+    monkeypatch.setattr(question_bank_module, "_load_bank", load)
+
+    asyncio.run(index.get(None, 1))
+    assert index._fresh(1) is None
+    assert index._loading == {}
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from src.models.topic_config import TopicConfig
+from src.services.sampler import overlap_matrix, sample_variants
+
+
+def _configs(*num_questions):
+    return [
+        TopicConfig(exam_config_id=1, topic_id=topic_id, num_questions=n, relative_weight=1)
+        for topic_id, n in enumerate(num_questions, 1)
+    ]
+
+
+def _pool(*question_ids, uses=0):
+    return [(question_id, uses) for question_id in question_ids]
+
+
+def test_every_variant_gets_the_requested_questions_per_topic():
+    candidates = {1: _pool(*range(1, 11)), 2: _pool(*range(11, 21))}
+    selection = sample_variants(candidates, _configs(3, 2), 4, np.random.default_rng(0))
+
+    assert len(selection.question_ids) == 4
+    for ids in selection.question_ids:
+        assert len(ids) == 5
+        assert len(set(ids)) == 5
+        assert set(ids[:3]) <= set(range(1, 11))
+        assert set(ids[3:]) <= set(range(11, 21))
+
+
+def test_variants_share_no_question_while_the_pool_allows():
+    selection = sample_variants({1: _pool(*range(1, 13))}, _configs(3), 4, np.random.default_rng(1))
+
+    assert selection.max_overlap == 0
+    assert len({q for ids in selection.question_ids for q in ids}) == 12
+
+
+def test_shared_questions_are_spread_evenly():
+    selection = sample_variants({1: _pool(*range(1, 7))}, _configs(4), 3, np.random.default_rng(2))
+
+    off_diagonal = selection.overlap[~np.eye(3, dtype=bool)]
+    assert off_diagonal.max() - off_diagonal.min() <= 1
+
+
+def test_same_seed_gives_the_same_selection():
+    candidates = {1: _pool(*range(1, 21))}
+    first = sample_variants(candidates, _configs(5), 3, np.random.default_rng(42))
+    second = sample_variants(candidates, _configs(5), 3, np.random.default_rng(42))
+
+    assert first.question_ids == second.question_ids
+
+
+def test_recently_used_questions_are_avoided_when_fresh_ones_suffice():
+    candidates = {1: _pool(1, 2, uses=2) + _pool(3, 4)}
+    selection = sample_variants(candidates, _configs(2), 1, np.random.default_rng(3))
+
+    assert sorted(selection.question_ids[0]) == [3, 4]
+
+
+def test_short_pool_is_rejected_instead_of_truncated():
+    with pytest.raises(ValueError, match="only 2 questions"):
+        sample_variants({1: _pool(1, 2)}, _configs(3), 2, np.random.default_rng(0))
+
+
+def test_overlap_matrix_counts_shared_questions():
+    overlap = overlap_matrix([[1, 2, 3], [3, 4, 5], [1, 3, 6]])
+
+    assert overlap.tolist() == [[3, 1, 2], [1, 3, 1], [2, 1, 3]]
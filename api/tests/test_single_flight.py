@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import pytest
+from types import SimpleNamespace
+from src.services import single_flight
+from src.services.single_flight import SingleFlight, caller_of, client_address
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(single_flight, "DISCONNECT_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(single_flight, "STREAM_START_GRACE_SECONDS", 0.05)
+
+
+class Generation:
+    """A fake generation that records how far it was pulled and whether it was closed."""
+
+    def __init__(self, chunks=5, size=1000):
+        self.chunks = chunks
+        self.size = size
+        self.starts = 0
+        self.produced = 0
+        self.closed = False
+        self.is_disconnected = None
+
+    async def start(self, is_disconnected):
+        self.starts += 1
+        self.is_disconnected = is_disconnected
+        await asyncio.sleep(0.01)
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            for i in range(self.chunks):
+                self.produced += 1
+                yield bytes([i]) * self.size
+        finally:
+            self.closed = True
+
+
+async def _read(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+def test_requests_joining_a_running_generation_share_it():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation()
+        first, second = await asyncio.gather(
+            flights.stream("k", generation.start), flights.stream("k", generation.start)
+        )
+        data = await asyncio.gather(_read(first), _read(second))
+        assert generation.starts == 1
+        assert data[0] == data[1] and len(data[0]) == 5000
+
+    asyncio.run(main())
+
+
+def test_late_joiner_reads_back_from_the_spool(monkeypatch):
+    monkeypatch.setattr(single_flight, "SPOOL_MEMORY_BYTES", 1500)
+    monkeypatch.setattr(single_flight, "READ_CHUNK_BYTES", 700)
+
+    async def main():
+        flights = SingleFlight()
+        generation = Generation()
+        first = aiter(await flights.stream("k", generation.start))
+        head = [await anext(first) for _ in range(3)]
+        late = await flights.stream("k", generation.start)
+        rest, late_data = await asyncio.gather(_read(first), _read(late))
+        assert generation.starts == 1
+        assert late_data == b"".join(head) + rest
+
+    asyncio.run(main())
+
+
+def test_finished_generations_are_not_reused():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation(chunks=1)
+        await _read(await flights.stream("k", generation.start))
+        await asyncio.sleep(0.01)
+        await _read(await flights.stream("k", generation.start))
+        assert generation.starts == 2
+
+    asyncio.run(main())
+
+
+def test_finished_flight_awaiting_its_callback_starts_afresh():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation(chunks=1)
+        await _read(await flights.stream("k", generation.start))
+        flight = flights._flights.get("k")
+        while flight is not None and not flight.done:
+            await asyncio.sleep(0)
+        if flight is not None:
+            flights._flights["k"] = flight  # Still registered, with its spool closed
+        assert len(await _read(await flights.stream("k", generation.start))) == 1000
+        assert generation.starts == 2
+
+    asyncio.run(main())
+
+
+def test_generation_waits_for_readers():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation(chunks=10)
+        stream = aiter(await flights.stream("k", generation.start))
+        await anext(stream)
+        await asyncio.sleep(0.03)
+        assert generation.produced <= 2
+        await stream.aclose()
+
+    asyncio.run(main())
+
+
+def test_generation_stops_once_every_client_has_gone():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation(chunks=10)
+        stream = aiter(await flights.stream("k", generation.start))
+        await anext(stream)
+        await stream.aclose()  # What the response does when its client disconnects
+        await asyncio.sleep(0.1)
+        assert generation.closed
+        assert generation.produced < 10
+        assert await generation.is_disconnected()
+        assert "k" not in flights._flights
+
+    asyncio.run(main())
+
+
+def test_requests_waiting_for_setup_keep_the_generation_alive():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation()
+        gone = False
+
+        async def is_disconnected():
+            return gone
+
+        waiting = asyncio.create_task(flights.stream("k", generation.start, is_disconnected))
+        await asyncio.sleep(0.005)  # Inside start, which takes 0.01s
+        assert not await generation.is_disconnected()
+        gone = True
+        assert await generation.is_disconnected()
+        await _read(await waiting)
+
+    asyncio.run(main())
+
+
+def test_unread_stream_does_not_keep_the_generation_alive():
+    async def main():
+        flights = SingleFlight()
+        generation = Generation()
+        await flights.stream("k", generation.start)
+        await asyncio.sleep(0.2)
+        assert generation.produced == 0
+        assert "k" not in flights._flights
+
+    asyncio.run(main())
+
+
+def test_setup_errors_reach_every_joined_request():
+    async def main():
+        flights = SingleFlight()
+
+        async def start(is_disconnected):
+            await asyncio.sleep(0.01)
+            raise ValueError("bad specs")
+
+        results = await asyncio.gather(
+            flights.stream("k", start), flights.stream("k", start), return_exceptions=True
+        )
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert "k" not in flights._flights
+
+    asyncio.run(main())
+
+
+def _request(peer, forwarded=None, authorization=None):
+    headers = {}
+    if forwarded:
+        headers["x-forwarded-for"] = forwarded
+    if authorization:
+        headers["authorization"] = authorization
+    return SimpleNamespace(client=SimpleNamespace(host=peer), headers=headers)
+
+
+def test_forwarded_address_is_used_behind_a_trusted_proxy():
+    assert client_address(_request("127.0.0.1", "203.0.113.7")) == "203.0.113.7"
+
+
+def test_forwarded_header_from_an_untrusted_peer_is_ignored():
+    assert client_address(_request("198.51.100.4", "203.0.113.7")) == "198.51.100.4"
+
+
+def test_spoofed_hops_left_of_the_client_are_ignored():
+    # The client claims to be 10.0.0.1; the trusted proxy appended the address it saw
+    assert client_address(_request("127.0.0.1", "10.0.0.1, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_chained_trusted_proxies_are_skipped(monkeypatch):
+    import ipaddress
+    networks = [ipaddress.ip_network("127.0.0.0/8"), ipaddress.ip_network("172.16.0.0/12")]
+    monkeypatch.setattr(single_flight, "TRUSTED_NETWORKS", networks)
+    assert client_address(_request("127.0.0.1", "203.0.113.7, 172.18.0.5")) == "203.0.113.7"
+
+
+def test_caller_is_the_token_hash_when_authenticated():
+    request = _request("127.0.0.1", "203.0.113.7", authorization="Bearer abc")
+    assert caller_of(request) == hashlib.sha256(b"Bearer abc").hexdigest()
@@ -0,0 +1,159 @@
+import asyncio
+import io
+import zipfile
+import pytest
+from src.services import exam
+
+
+class Scratch:
+    """Stands in for the generation's TemporaryDirectory."""
+
+    def __init__(self):
+        self.cleaned = False
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+class Jobs:
+    """Compile jobs that finish after their delays and record what happened to them."""
+
+    def __init__(self, *delays):
+        self.delays = delays
+        self.started = []
+        self.cancelled = []
+
+    def __iter__(self):
+        return iter([self._job(n, delay) for n, delay in enumerate(self.delays, 1)])
+
+    def __len__(self):
+        return len(self.delays)
+
+    def _job(self, n, delay):
+        async def job():
+            self.started.append(n)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(n)
+                raise
+            return [(f"exams/exam_var_{n}.pdf", f"%PDF-{n}".encode())]
+        return job
+
+
+class Callbacks:
+    def __init__(self):
+        self.completed = 0
+        self.aborted = 0
+
+    async def on_complete(self):
+        self.completed += 1
+
+    async def on_abort(self):
+        self.aborted += 1
+
+
+@pytest.fixture(autouse=True)
+def two_workers(monkeypatch):
+    monkeypatch.setattr(exam, "_compile_workers", lambda: 2)
+    monkeypatch.setattr(exam, "DISCONNECT_POLL_SECONDS", 0.01)
+
+
+def test_entries_follow_job_order_and_completion_is_persisted():
+    tmp, jobs, callbacks = Scratch(), Jobs(0.03, 0.01, 0.0), Callbacks()
+
+    async def main():
+        stream = exam._stream_zip(tmp, list(jobs), callbacks.on_complete, callbacks.on_abort)
+        data = b"".join([chunk async for chunk in stream])
+        await asyncio.sleep(0)
+        return data
+
+    data = asyncio.run(main())
+    names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert names == ["exams/exam_var_1.pdf", "exams/exam_var_2.pdf", "exams/exam_var_3.pdf"]
+    assert callbacks.completed == 1 and callbacks.aborted == 0
+    assert tmp.cleaned
+
+
+def test_closing_the_stream_cancels_running_jobs():
+    tmp, jobs, callbacks = Scratch(), Jobs(0.0, 10, 10, 10), Callbacks()
+
+    async def main():
+        stream = exam._stream_zip(tmp, list(jobs), callbacks.on_complete, callbacks.on_abort)
+        await anext(stream)
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    # Job 3 was scheduled when job 1 finished, and cancelled before it could start
+    assert jobs.started == [1, 2]
+    assert jobs.cancelled == [2]
+    assert tmp.cleaned
+    assert callbacks.completed == 0 and callbacks.aborted == 0
+
+
+def test_disconnected_client_stops_the_generation():
+    tmp, jobs, callbacks = Scratch(), Jobs(10, 10), Callbacks()
+
+    async def gone():
+        return True
+
+    async def main():
+        stream = exam._stream_zip(tmp, list(jobs), callbacks.on_complete, callbacks.on_abort, gone)
+        return [chunk async for chunk in stream]
+
+    assert asyncio.run(main()) == []
+    assert jobs.cancelled == [1, 2]
+    assert tmp.cleaned
+
+
+def test_abandoning_after_persisting_discards_the_exams():
+    tmp, jobs, callbacks = Scratch(), Jobs(0.0), Callbacks()
+
+    async def main():
+        stream = exam._stream_zip(tmp, list(jobs), callbacks.on_complete, callbacks.on_abort)
+        await anext(stream)  # The entry
+        await anext(stream)  # The central directory, sent after on_complete
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert callbacks.completed == 1 and callbacks.aborted == 1
+    assert tmp.cleaned
+
+
+def test_failed_completion_is_not_discarded():
+    tmp, callbacks = Scratch(), Callbacks()
+
+    async def commit_fails():
+        raise RuntimeError("commit failed")
+
+    async def main():
+        stream = exam._stream_zip(tmp, list(Jobs(0.0)), commit_fails, callbacks.on_abort)
+        with pytest.raises(RuntimeError, match="commit failed"):
+            async for _ in stream:
+                pass
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert callbacks.aborted == 0
+    assert tmp.cleaned
+
+
+def test_failed_job_aborts_the_stream():
+    tmp, callbacks = Scratch(), Callbacks()
+    jobs = Jobs(10)
+
+    async def broken():
+        raise RuntimeError("pdflatex failed")
+
+    async def main():
+        stream = exam._stream_zip(tmp, [broken] + list(jobs), callbacks.on_complete, callbacks.on_abort)
+        with pytest.raises(RuntimeError, match="pdflatex failed"):
+            async for _ in stream:
+                pass
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert jobs.cancelled == [1]
+    assert tmp.cleaned and callbacks.completed == 0
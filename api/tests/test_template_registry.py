@@ -0,0 +1,55 @@
+import pytest
+from src.services.template_registry import LatexTemplate, TemplateRegistry, template_registry
+
+
+def test_placeholders_are_upper_case_words_only():
+    template = LatexTemplate("T.tex", "\\def\\a#1{#1} #NUM_QUESTIONS #Fraction #X2 #FRACTIONs")
+
+    assert template.placeholders == {"NUM_QUESTIONS", "X2"}
+    assert not template.is_static
+
+
+def test_render_fills_every_placeholder_verbatim():
+    template = LatexTemplate("T.tex", "#A and #B, #A again")
+
+    assert template.render(A="\\textbf{1}", B=2) == "\\textbf{1} and 2, \\textbf{1} again"
+
+
+def test_render_reports_missing_values():
+    with pytest.raises(KeyError, match="missing values for B"):
+        LatexTemplate("T.tex", "#A #B").render(A=1)
+
+
+def test_registry_writes_static_templates_and_rendered_files(tmp_path):
+    templates_dir = tmp_path / "templates"
+    templates_dir.mkdir()
+    (templates_dir / "static.tex").write_text("\\relax")
+    (templates_dir / "dynamic.tex").write_text("#VALUE")
+    (templates_dir / "notes.txt").write_text("ignored")
+    registry = TemplateRegistry(str(templates_dir))
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+
+    registry.write_workdir(str(workdir), {"dynamic.tex": registry.render("dynamic.tex", VALUE=7), "main.tex": "main"})
+
+    assert sorted(p.name for p in workdir.iterdir()) == ["dynamic.tex", "main.tex", "static.tex"]
+    assert (workdir / "dynamic.tex").read_text() == "7"
+
+
+def test_version_follows_template_contents(tmp_path):
+    (tmp_path / "a.tex").write_text("one")
+    registry = TemplateRegistry(str(tmp_path))
+    first = registry.version
+
+    (tmp_path / "a.tex").write_text("two")
+    registry.load()
+
+    assert registry.version != first
+
+
+def test_shipped_rules_template_renders():
+    rules = template_registry.render("Rules.tex", NUM_QUESTIONS=12, FRACTION=0.25)
+
+    assert "12" in rules
+    assert "0.25" in rules
+    assert "#" not in rules.replace("\\#", "")